@@ -0,0 +1,267 @@
+import re
+from collections import Counter
+from urllib.parse import urlparse
+
+from sqlalchemy import text
+
+from canonical import canonicalize_url
+from models import Product, SessionCategory, SessionStats
+from responses import PRODUCT_SELECT, product_dict
+
+# A price amount: thousands groups (",", "." or a space between groups of
+# three) with optional decimals, or plain digits with an optional fraction
+NUMBER_RE = re.compile(
+    r"(?P<grouped>[1-9]\d{0,2}(?:[ ,.]\d{3}(?!\d))+)(?P<decimals>[.,]\d{1,2}(?!\d))?"
+    r"|(?P<plain>\d+)(?:[.,](?P<fraction>\d+))?"
+)
+BACKFILL_CHUNK = 2000  # Products given a key and price per transaction when backfilling
+DIFF_LIMIT = 500  # Default products listed per diff section; counts are always complete
+
+STATS_UPSERT = text("""
+    INSERT INTO session_stats (
+        session_id, product_count, priced_count, price_min, price_max, discount_count
+    )
+    SELECT :session_id, :product_count, :priced_count, :price_min, :price_max, :discount_count
+    WHERE EXISTS (SELECT 1 FROM sessions WHERE id = :session_id)
+    ON CONFLICT (session_id) DO UPDATE SET
+        product_count = product_count + excluded.product_count,
+        priced_count = priced_count + excluded.priced_count,
+        price_min = min(coalesce(price_min, excluded.price_min), coalesce(excluded.price_min, price_min)),
+        price_max = max(coalesce(price_max, excluded.price_max), coalesce(excluded.price_max, price_max)),
+        discount_count = discount_count + excluded.discount_count
+""")
+CATEGORY_UPSERT = text("""
+    INSERT INTO session_categories (session_id, category, product_count)
+    SELECT :session_id, :category, :product_count
+    WHERE EXISTS (SELECT 1 FROM sessions WHERE id = :session_id)
+    ON CONFLICT (session_id, category) DO UPDATE SET
+        product_count = product_count + excluded.product_count
+""")
+MEDIAN_QUERY = text("""
+    SELECT avg(price_value) FROM (
+        SELECT price_value FROM products
+        WHERE session_id = :session_id AND price_value IS NOT NULL
+        ORDER BY price_value
+        LIMIT 2 - :count % 2 OFFSET (:count - 1) / 2
+    )
+""")
+
+
+def parse_price(value):
+    """Numeric value of a price string such as "$1,299.00" or "3,49 €"; None if absent.
+
+    Only the first amount is read, so a trailing size ("$3.49 500g") is
+    ignored. A lone separator before exactly three digits is a thousands
+    separator ("1.299" is 1299), as prices rarely have three decimals.
+    """
+    match = NUMBER_RE.search(value or "")
+    if not match:
+        return None
+    if match["grouped"]:
+        number = re.sub(r"[\s,.]", "", match["grouped"])
+        if match["decimals"]:
+            number += "." + match["decimals"][1:]
+    else:
+        number = match["plain"]
+        if match["fraction"]:
+            number += "." + match["fraction"]
+    return float(number)
+
+
+def product_key(url):
+    """Identity of a product across sessions: its canonical URL without scheme or host.
+
+    Dropping the host lets http/https and www/bare-domain scrapes of a
+    store match; the path is lowercased and trailing slashes dropped.
+    """
+    parsed = urlparse(canonicalize_url(url))
+    key = parsed.path.lower().rstrip("/") or "/"
+    return f"{key}?{parsed.query}" if parsed.query else key
+
+
+def is_discounted(row):
+    original = parse_price(row.get("original_price"))
+    return original is not None and row["price_value"] is not None and original > row["price_value"]
+
+
+def add_to_session_stats(db, rows):
+    """Fold newly inserted product rows into their session's aggregates (no commit)"""
+    sessions = {}
+    for row in rows:
+        sessions.setdefault(row["session_id"], []).append(row)
+    for session_id, session_rows in sessions.items():
+        prices = [row["price_value"] for row in session_rows if row["price_value"] is not None]
+        db.execute(
+            STATS_UPSERT,
+            {
+                "session_id": session_id,
+                "product_count": len(session_rows),
+                "priced_count": len(prices),
+                "price_min": min(prices, default=None),
+                "price_max": max(prices, default=None),
+                "discount_count": sum(1 for row in session_rows if is_discounted(row)),
+            },
+        )
+        categories = Counter(row.get("category") or "" for row in session_rows)
+        db.execute(
+            CATEGORY_UPSERT,
+            [
+                {"session_id": session_id, "category": category, "product_count": count}
+                for category, count in categories.items()
+            ],
+        )
+
+
+def session_analytics(db, session_id):
+    """Aggregates for one session; None if it has none (no products yet)"""
+    stats = db.get(SessionStats, session_id)
+    if stats is None:
+        return None
+    median = None
+    if stats.priced_count:
+        # An index seek on (session_id, price_value), not a sort of the session
+        median = db.execute(
+            MEDIAN_QUERY, {"session_id": session_id, "count": stats.priced_count}
+        ).scalar()
+    categories = (
+        db.query(SessionCategory.category, SessionCategory.product_count)
+        .filter(SessionCategory.session_id == session_id)
+        .order_by(SessionCategory.product_count.desc(), SessionCategory.category)
+        .all()
+    )
+    return {
+        "session_id": session_id,
+        "product_count": stats.product_count,
+        "priced_count": stats.priced_count,
+        "price_min": stats.price_min,
+        "price_max": stats.price_max,
+        "price_median": median,
+        "discount_count": stats.discount_count,
+        "categories": [
+            {"category": category or None, "product_count": count}
+            for category, count in categories
+        ],
+    }
+
+
+def _missing(db, session_id, other_session_id, limit):
+    """Products of session_id whose key has no match in other_session_id"""
+    where = """
+        FROM products p
+        WHERE p.session_id = :session_id AND NOT EXISTS (
+            SELECT 1 FROM products o
+            WHERE o.session_id = :other AND o.product_key = p.product_key
+        )
+    """
+    params = {"session_id": session_id, "other": other_session_id}
+    count = db.execute(text(f"SELECT count(*) {where}"), params).scalar()
+    columns = ", ".join(f"p.{column}" for column in PRODUCT_SELECT.split(", "))
+    rows = db.execute(
+        text(f"SELECT {columns} {where} ORDER BY p.name LIMIT :limit"),
+        {**params, "limit": limit},
+    ).fetchall()
+    return count, [product_dict(row) for row in rows]
+
+
+def _price_changes(db, base_session_id, session_id, limit):
+    join = """
+        FROM products n
+        JOIN products o ON o.session_id = :base AND o.product_key = n.product_key
+        WHERE n.session_id = :session_id
+          AND n.price_value IS NOT NULL AND o.price_value IS NOT NULL
+          AND n.price_value != o.price_value
+    """
+    params = {"session_id": session_id, "base": base_session_id}
+    count = db.execute(text(f"SELECT count(*) {join}"), params).scalar()
+    rows = db.execute(
+        text(f"""
+            SELECT n.product_key, n.name, n.url, o.current_price, n.current_price,
+                   o.price_value, n.price_value
+            {join}
+            ORDER BY abs(n.price_value - o.price_value) / o.price_value DESC, n.name
+            LIMIT :limit
+        """),
+        {**params, "limit": limit},
+    ).fetchall()
+    changes = [
+        {
+            "product_key": key,
+            "name": name,
+            "url": url,
+            "old_price": old_price,
+            "new_price": new_price,
+            "change": round(new_value - old_value, 2),
+            "change_percent": round((new_value - old_value) / old_value * 100, 1)
+            if old_value
+            else None,
+        }
+        for key, name, url, old_price, new_price, old_value, new_value in rows
+    ]
+    return count, changes
+
+
+def session_diff(db, base_session_id, session_id, limit=DIFF_LIMIT):
+    """Products added, removed and re-priced in session_id since base_session_id.
+
+    Products are matched on product_key through the (session_id,
+    product_key) index; price changes are listed largest relative change
+    first.
+    """
+    added_count, added = _missing(db, session_id, base_session_id, limit)
+    removed_count, removed = _missing(db, base_session_id, session_id, limit)
+    changed_count, changed = _price_changes(db, base_session_id, session_id, limit)
+    return {
+        "base_session_id": base_session_id,
+        "session_id": session_id,
+        "counts": {
+            "added": added_count,
+            "removed": removed_count,
+            "price_changed": changed_count,
+        },
+        "added": added,
+        "removed": removed,
+        "price_changed": changed,
+    }
+
+
+def backfill_analytics(db):
+    """Key, price and aggregate products saved before these columns existed"""
+    backfilled = set()
+    while True:
+        rows = (
+            db.query(Product.id, Product.session_id, Product.url, Product.current_price)
+            .filter(Product.product_key.is_(None))
+            .limit(BACKFILL_CHUNK)
+            .all()
+        )
+        if not rows:
+            break
+        db.execute(
+            text("UPDATE products SET product_key = :key, price_value = :price WHERE id = :id"),
+            [
+                {
+                    "id": row.id,
+                    "key": product_key(row.url),
+                    "price": parse_price(row.current_price),
+                }
+                for row in rows
+            ],
+        )
+        db.commit()
+        backfilled.update(row.session_id for row in rows)
+
+    for session_id in backfilled:
+        # Rebuild from scratch: the session may have been partly aggregated already
+        db.query(SessionStats).filter(SessionStats.session_id == session_id).delete()
+        db.query(SessionCategory).filter(SessionCategory.session_id == session_id).delete()
+        rows = db.execute(
+            text("""
+                SELECT session_id, current_price, original_price, category, price_value
+                FROM products WHERE session_id = :session_id
+            """),
+            {"session_id": session_id},
+        ).mappings()
+        add_to_session_stats(db, [dict(row) for row in rows])
+        db.commit()
+    if backfilled:
+        print(f"Backfilled analytics for {len(backfilled)} sessions")
@@ -0,0 +1,157 @@
+"""
+Build a reproducible synthetic GroceryGhost database for benchmarking.
+
+    python -m benchmarks.generate --out bench.db --sessions 2000 --products 1000
+
+The schema comes from models.py (through ensure_schema), so index changes
+are benchmarked as they would ship. The same --seed always produces the
+same database.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+CATEGORIES = [
+    "Dairy", "Bakery", "Produce", "Meat", "Seafood", "Frozen", "Pantry", "Snacks",
+    "Beverages", "Household", "Personal Care", "Baby", "Pet", "Deli", "Alcohol",
+]
+ADJECTIVES = [
+    "Organic", "Fresh", "Free Range", "Wholegrain", "Classic", "Low Fat", "Family Size", "Premium",
+]
+NOUNS = [
+    "Milk", "Eggs", "Bread", "Apples", "Chicken", "Salmon",
+    "Rice", "Pasta", "Coffee", "Tea", "Cheese", "Yogurt",
+]
+SIZES = ["250g", "500g", "1kg", "1L", "2L", "6 pack", "12 pack", "400g"]
+TAGS = ["vegan", "vegetarian", "gluten-free", "organic", "dairy-free", "nut-free"]
+STATUSES = ["COMPLETED"] * 8 + ["FAILED", "CANCELED"]
+STORES = 150  # Distinct store domains the sessions are spread over
+CATALOG = 5000  # Product pages per store; sessions of a store overlap, as real re-scrapes do
+INSERT_CHUNK = 20000  # Rows per executemany
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--out", default="bench.db", help="SQLite file to create (replaced if it exists)"
+    )
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--products", type=int, default=1000, help="Average products per session")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser.parse_args(argv)
+
+
+def make_uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def random_price(rng):
+    """A grocery-like price: mostly a few dollars, with a long tail"""
+    return (int(rng.lognormvariate(1.3, 0.8) * 100) + 49) / 100
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    for path in (args.out, f"{args.out}-wal", f"{args.out}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    # database.py reads the path at import time
+    os.environ["DATABASE_PATH"] = args.out
+    from analytics import add_to_session_stats, product_key
+    from database import SessionLocal, engine, ensure_schema
+
+    ensure_schema()
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    epoch = datetime(2025, 1, 1)  # Naive UTC, as SQLAlchemy stores it
+    product_sql = """
+        INSERT INTO products (
+            id, session_id, url, name, current_price, original_price, unit_size,
+            image_url, category, dietary_tags, price_value, product_key
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    session_sql = """
+        INSERT INTO sessions (
+            id, url, name, total_pages, scraped_pages, status, started_at,
+            completed_at, error, stop_reason
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+    total = 0
+    products = []
+    stats_rows = []
+    db = SessionLocal()
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute("PRAGMA synchronous = OFF")
+        for index in range(args.sessions):
+            session_id = make_uuid(rng)
+            store = rng.randrange(STORES)
+            base_url = f"https://store{store}.example.com"
+            count = max(0, int(rng.gauss(args.products, args.products / 4)))
+            pages = count + rng.randrange(count // 2 + 1)
+            started_at = epoch + timedelta(minutes=index * 15 + rng.randrange(15))
+            status = rng.choice(STATUSES)
+            cursor.execute(
+                session_sql,
+                (
+                    session_id, base_url, f"Store {store}", pages, pages, status,
+                    started_at.isoformat(" "),
+                    (started_at + timedelta(minutes=20)).isoformat(" "),
+                    "Synthetic failure" if status == "FAILED" else None,
+                    "all_pages_processed" if status == "COMPLETED" else None,
+                ),
+            )
+            for item in rng.sample(range(CATALOG), min(count, CATALOG)):
+                price = random_price(rng)
+                original = round(price * 1.25, 2) if rng.random() < 0.2 else None
+                url = f"{base_url}/product/item-{item}"
+                category = CATEGORIES[item % len(CATEGORIES)]
+                row = {
+                    "session_id": session_id,
+                    "category": category,
+                    "current_price": f"${price:.2f}",
+                    "original_price": f"${original:.2f}" if original else None,
+                    "price_value": price,
+                }
+                stats_rows.append(row)
+                products.append(
+                    (
+                        make_uuid(rng), session_id, url,
+                        f"{ADJECTIVES[item % len(ADJECTIVES)]} {NOUNS[item % len(NOUNS)]} {item}",
+                        row["current_price"], row["original_price"], SIZES[item % len(SIZES)],
+                        f"{base_url}/img/{item}.jpg", category,
+                        ",".join(sorted(rng.sample(TAGS, rng.randrange(3)))) or None,
+                        price, product_key(url),
+                    )
+                )
+            if len(products) >= INSERT_CHUNK or index == args.sessions - 1:
+                cursor.executemany(product_sql, products)
+                raw.commit()
+                total += len(products)
+                products = []
+                add_to_session_stats(db, stats_rows)
+                db.commit()
+                stats_rows = []
+                print(f"{index + 1}/{args.sessions} sessions, {total} products", file=sys.stderr)
+        cursor.execute("ANALYZE")
+        raw.commit()
+    finally:
+        raw.close()
+        db.close()
+
+    print(
+        f"Wrote {args.sessions} sessions and {total} products to {args.out} "
+        f"in {time.perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Concurrent load test of the read endpoints, compared against a stored baseline.
+
+    python -m benchmarks.generate --out bench.db
+    python -m benchmarks.load --db bench.db --serve           # serve bench.db and load it
+    python -m benchmarks.load --url http://127.0.0.1:8000/api # or load a running server
+    python -m benchmarks.load --db bench.db --serve --save-baseline
+
+Reports throughput and p50/p95/p99 latency per endpoint. Exits with status 1
+when an endpoint's p95 latency or throughput is worse than the baseline by
+more than --tolerance, so index and query changes come with numbers.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+SAMPLE_SESSIONS = 500  # Sessions requests are spread over
+PAGE_SIZE = 100
+SERVER_START_TIMEOUT = 60
+
+# (name, weight): how often each endpoint is requested relative to the others
+SCENARIOS = [
+    ("sessions", 3),
+    ("session_detail", 3),
+    ("products_page", 3),
+    ("analytics", 2),
+    ("export", 1),
+]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--url", default="http://127.0.0.1:8000/api", help="API base URL")
+    parser.add_argument("--db", help="Database to sample session ids from (and serve)")
+    parser.add_argument("--serve", action="store_true", help="Start the API on --db first")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="Allowed regression before failing (0.25 = 25%%)"
+    )
+    parser.add_argument("--report", type=Path, help="Also write the results as JSON here")
+    return parser.parse_args(argv)
+
+
+def sample_sessions(args):
+    """(session_id, product_count) pairs to spread requests over"""
+    if args.db:
+        connection = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+        try:
+            rows = connection.execute(
+                """
+                SELECT s.session_id, s.product_count FROM session_stats s
+                ORDER BY s.session_id LIMIT ?
+                """,
+                (SAMPLE_SESSIONS,),
+            ).fetchall()
+        finally:
+            connection.close()
+    else:
+        sessions = requests.get(f"{args.url}/sessions", timeout=30).json()["sessions"]
+        rows = [(s["id"], s["product_count"]) for s in sessions]
+    if not rows:
+        sys.exit("No sessions to load-test; generate a database first")
+    return rows
+
+
+def request_for(scenario, session_id, product_count, rng):
+    """(path, params) of one request for a scenario"""
+    if scenario == "sessions":
+        return "/sessions", None
+    if scenario == "session_detail":
+        return f"/session/{session_id}", None
+    if scenario == "products_page":
+        offset = rng.randrange(max(product_count - PAGE_SIZE, 0) + 1)
+        return f"/session/{session_id}/products", {"offset": offset, "limit": PAGE_SIZE}
+    if scenario == "analytics":
+        return f"/session/{session_id}/analytics", None
+    return f"/session/{session_id}/export", None
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def run_load(args, sessions):
+    """Hammer the API from args.concurrency threads; returns {scenario: [(seconds, ok)]}"""
+    names = [name for name, _ in SCENARIOS]
+    weights = [weight for _, weight in SCENARIOS]
+    samples = {name: [] for name in names}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def worker(index):
+        rng = random.Random(args.seed + index)
+        http = requests.Session()
+        local = []
+        while time.perf_counter() < deadline:
+            scenario = rng.choices(names, weights)[0]
+            session_id, product_count = rng.choice(sessions)
+            path, params = request_for(scenario, session_id, product_count, rng)
+            started = time.perf_counter()
+            try:
+                response = http.get(f"{args.url}{path}", params=params, timeout=60)
+                ok = response.status_code == 200
+                response.content  # Include the body transfer
+            except requests.RequestException:
+                ok = False
+            local.append((scenario, time.perf_counter() - started, ok))
+        http.close()
+        with lock:
+            for scenario, seconds, ok in local:
+                samples[scenario].append((seconds, ok))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def summarize(samples, duration):
+    results = {}
+    everything = []
+    for scenario, values in samples.items():
+        latencies = sorted(seconds for seconds, _ in values)
+        everything.extend(latencies)
+        results[scenario] = _summary(latencies, sum(1 for _, ok in values if not ok), duration)
+    results["total"] = _summary(
+        sorted(everything), sum(r["errors"] for r in results.values()), duration
+    )
+    return results
+
+
+def _summary(latencies, errors, duration):
+    def ms(q):
+        value = percentile(latencies, q)
+        return round(value * 1000, 1) if value is not None else None
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / duration, 1),
+        "p50_ms": ms(50),
+        "p95_ms": ms(95),
+        "p99_ms": ms(99),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print a comparison with the baseline; returns the regressed endpoints"""
+    regressions = []
+    print(f"\n{'endpoint':<16}{'p95 ms':>10}{'base':>10}{'Δ':>8}{'req/s':>10}{'base':>10}{'Δ':>8}")
+    for scenario, result in results.items():
+        base = baseline["results"].get(scenario)
+        if not base or not base["p95_ms"] or not result["p95_ms"]:
+            continue
+        latency_change = result["p95_ms"] / base["p95_ms"] - 1
+        throughput_change = result["throughput_rps"] / base["throughput_rps"] - 1
+        regressed = latency_change > tolerance or throughput_change < -tolerance
+        if regressed:
+            regressions.append(scenario)
+        print(
+            f"{scenario:<16}{result['p95_ms']:>10}{base['p95_ms']:>10}{latency_change:>+8.0%}"
+            f"{result['throughput_rps']:>10}{base['throughput_rps']:>10}{throughput_change:>+8.0%}"
+            + ("  REGRESSED" if regressed else "")
+        )
+    return regressions
+
+
+def print_results(results):
+    print(f"\n{'endpoint':<16}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for scenario, r in results.items():
+        print(
+            f"{scenario:<16}{r['requests']:>10}{r['errors']:>8}{r['throughput_rps']:>10}"
+            f"{r['p50_ms']!s:>10}{r['p95_ms']!s:>10}{r['p99_ms']!s:>10}"
+        )
+
+
+def start_server(args):
+    """Run the API on args.db in a subprocess; returns the process once it answers"""
+    port = args.url.rsplit(":", 1)[-1].split("/", 1)[0]
+    env = {**os.environ, "DATABASE_PATH": str(Path(args.db).resolve())}
+    env.setdefault("GEMINI_API_KEY", "benchmark")  # The agent needs one; no LLM calls are made
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", port, "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{args.url}/sessions", timeout=5)
+            return server
+        except requests.RequestException:
+            if server.poll() is not None:
+                sys.exit("The API server exited during startup")
+            time.sleep(0.5)
+    server.terminate()
+    sys.exit("The API server did not start in time")
+
+
+def database_scale(db):
+    if not db:
+        return None
+    connection = sqlite3.connect(f"file:{db}?mode=ro", uri=True)
+    try:
+        sessions, products = connection.execute(
+            "SELECT count(*), coalesce(sum(product_count), 0) FROM session_stats"
+        ).fetchone()
+    finally:
+        connection.close()
+    return {"sessions": sessions, "products": products}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.serve and not args.db:
+        sys.exit("--serve needs --db")
+    server = start_server(args) if args.serve else None
+    try:
+        sessions = sample_sessions(args)
+        print(
+            f"Loading {args.url} from {args.concurrency} threads for {args.duration:.0f}s "
+            f"over {len(sessions)} sessions"
+        )
+        samples = run_load(args, sessions)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    results = summarize(samples, args.duration)
+    print_results(results)
+    run = {
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "scale": database_scale(args.db),
+        "results": results,
+    }
+    if args.report:
+        args.report.write_text(json.dumps(run, indent=2) + "\n")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(run, indent=2) + "\n")
+        print(f"\nSaved baseline to {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print("\nNo baseline to compare against; run with --save-baseline to record one")
+        return
+    baseline = json.loads(args.baseline.read_text())
+    if (baseline.get("scale"), baseline.get("concurrency")) != (run["scale"], run["concurrency"]):
+        print(
+            f"\nNote: the baseline was recorded at scale {baseline.get('scale')} with "
+            f"concurrency {baseline.get('concurrency')}; numbers may not be comparable"
+        )
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\nRegressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import threading
+import time
+
+# Rough unit costs in USD, used to enforce max_spend
+LLM_COST_PER_MILLION_TOKENS = 0.10
+PROXY_COST_PER_GB = 1.50
+
+# LLM calls reserve an estimate of their usage up front, sized from the prompt:
+# roughly four characters per token, plus the system prompt and output schema
+LLM_CHARS_PER_TOKEN = 4
+LLM_PROMPT_OVERHEAD_TOKENS = 600
+LLM_OUTPUT_TOKENS_ESTIMATE = 400
+
+# Reasons recorded on the session when a scrape stops
+STOP_ALL_PAGES_PROCESSED = "all_pages_processed"
+STOP_MAX_PRODUCTS = "max_products"
+STOP_MAX_PAGES = "max_pages"
+STOP_MAX_LLM_TOKENS = "max_llm_tokens"
+STOP_MAX_SECONDS = "max_seconds"
+STOP_MAX_SPEND = "max_spend"
+STOP_CANCELED = "canceled"
+
+
+class ScrapeBudget:
+    """Thread-safe limits for a single scrape.
+
+    Work is admitted before it starts (pages, LLM calls) rather than checked
+    after it finishes. Pages are counted exactly; LLM calls reserve an
+    estimate of their usage, scaled up by how far real calls have exceeded
+    their estimates so far, so token and spend limits can only be overshot
+    by the estimation error of the calls in flight. Once any limit is hit
+    the budget is stopped and every later admission is refused, which lets
+    discovery and page workers wind down cooperatively.
+    """
+
+    def __init__(
+        self,
+        max_products=None,
+        max_pages=None,
+        max_llm_tokens=None,
+        max_seconds=None,
+        max_spend=None,
+    ):
+        self.max_products = max_products
+        self.max_pages = max_pages
+        self.max_llm_tokens = max_llm_tokens
+        self.max_seconds = max_seconds
+        self.max_spend = max_spend
+
+        self.products = 0
+        self.pages_started = 0
+        self.llm_tokens = 0
+        self.bytes_fetched = 0
+        self.stop_reason = None
+        # CancellationToken for the session; cancelling it stops the budget too
+        self.token = None
+
+        self._reserved_tokens = 0
+        self._estimated_tokens = 0  # Estimates of completed calls, for calibration
+        self._started_at = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    @classmethod
+    def from_request(cls, request):
+        return cls(
+            max_products=request.max_products,
+            max_pages=request.max_pages,
+            max_llm_tokens=request.max_llm_tokens,
+            max_seconds=request.max_seconds,
+            max_spend=request.max_spend,
+        )
+
+    def start(self):
+        """Start the wall-clock budget; called when the scrape actually begins"""
+        self._started_at = time.monotonic()
+
+    @property
+    def elapsed(self):
+        if self._started_at is None:
+            return 0.0
+        return time.monotonic() - self._started_at
+
+    @property
+    def spend(self):
+        return self._spend(self.llm_tokens, self.bytes_fetched)
+
+    @staticmethod
+    def _spend(tokens, fetched_bytes):
+        return (
+            tokens / 1_000_000 * LLM_COST_PER_MILLION_TOKENS
+            + fetched_bytes / 1_000_000_000 * PROXY_COST_PER_GB
+        )
+
+    @property
+    def stopped(self):
+        if not self._stopped.is_set():
+            if self.token is not None and self.token.cancelled:
+                self.stop(STOP_CANCELED)
+            elif self._deadline_passed():
+                self.stop(STOP_MAX_SECONDS)
+        return self._stopped.is_set()
+
+    def stop(self, reason):
+        """Stop the scrape; the first reason recorded wins"""
+        with self._lock:
+            if self.stop_reason is None:
+                self.stop_reason = reason
+            self._stopped.set()
+
+    def _deadline_passed(self):
+        return self.max_seconds is not None and self.elapsed >= self.max_seconds
+
+    def admit_page(self):
+        """Reserve one page fetch; returns False once the scrape must stop"""
+        if self.stopped:
+            return False
+        with self._lock:
+            if self.max_pages is not None and self.pages_started >= self.max_pages:
+                reason = STOP_MAX_PAGES
+            else:
+                self.pages_started += 1
+                return True
+        self.stop(reason)
+        return False
+
+    def _estimate_llm_tokens(self, prompt_chars, output_tokens):
+        estimate = (
+            prompt_chars // LLM_CHARS_PER_TOKEN
+            + LLM_PROMPT_OVERHEAD_TOKENS
+            + output_tokens
+        )
+        # Calls so far used more than estimated: scale up to match
+        if self._estimated_tokens and self.llm_tokens > self._estimated_tokens:
+            estimate = estimate * self.llm_tokens // self._estimated_tokens
+        return estimate
+
+    def reserve_llm_call(self, prompt_chars, output_tokens=LLM_OUTPUT_TOKENS_ESTIMATE):
+        """Reserve tokens for one LLM call on a prompt of prompt_chars characters.
+
+        Returns the reservation to pass to record_llm_usage, or None if the
+        call would exceed the budget.
+        """
+        if self.stopped:
+            return None
+        with self._lock:
+            estimate = self._estimate_llm_tokens(prompt_chars, output_tokens)
+            tokens = self.llm_tokens + self._reserved_tokens + estimate
+            if self.max_llm_tokens is not None and tokens > self.max_llm_tokens:
+                reason = STOP_MAX_LLM_TOKENS
+            elif (
+                self.max_spend is not None
+                and self._spend(tokens, self.bytes_fetched) > self.max_spend
+            ):
+                reason = STOP_MAX_SPEND
+            else:
+                self._reserved_tokens += estimate
+                return estimate
+        self.stop(reason)
+        return None
+
+    def record_llm_usage(self, reservation, tokens):
+        """Release a reservation made by reserve_llm_call and charge actual usage"""
+        with self._lock:
+            self._reserved_tokens -= reservation
+            if tokens:
+                self._estimated_tokens += reservation
+                self.llm_tokens += tokens
+
+    def record_bytes(self, count):
+        with self._lock:
+            self.bytes_fetched += count
+            over_spend = self.max_spend is not None and self.spend >= self.max_spend
+        if over_spend:
+            self.stop(STOP_MAX_SPEND)
+
+    def add_product(self):
+        """Count a found product; returns False if it falls outside max_products"""
+        with self._lock:
+            if self.max_products is not None and self.products >= self.max_products:
+                return False
+            self.products += 1
+            reached = (
+                self.max_products is not None and self.products >= self.max_products
+            )
+        if reached:
+            self.stop(STOP_MAX_PRODUCTS)
+        return True
+
+    def summary(self):
+        return (
+            f"pages={self.pages_started}, products={self.products}, "
+            f"llm_tokens={self.llm_tokens}, bytes={self.bytes_fetched}, "
+            f"spend=${self.spend:.4f}, elapsed={self.elapsed:.1f}s"
+        )
@@ -0,0 +1,124 @@
+import asyncio
+import threading
+
+# Reasons a scrape can be cancelled for
+CANCEL_REQUESTED = "canceled"
+CANCEL_DELETED = "deleted"
+
+
+class ScrapeCancelled(Exception):
+    """Raised inside scrape work when its session has been cancelled"""
+
+
+class CancellationToken:
+    """Cross-thread cancellation signal for one scrape session.
+
+    Workers poll `cancelled` at checkpoints; resources that block (HTTP
+    sessions, running LLM calls) register callbacks so they are torn down
+    the moment cancel() is called rather than at the next checkpoint.
+    """
+
+    def __init__(self):
+        self.reason = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason=CANCEL_REQUESTED):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error running cancellation callback: {e}")
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise ScrapeCancelled(self.reason)
+
+    def add_callback(self, callback):
+        """Run callback on cancel, or immediately if already cancelled"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def register(self, resource):
+        """Close resource (anything with .close()) on cancel; returns it for chaining"""
+        self.add_callback(resource.close)
+        return resource
+
+    def unregister(self, resource):
+        self.remove_callback(resource.close)
+
+    async def run(self, coro):
+        """Await coro, cancelling it as soon as the token is cancelled"""
+        task = asyncio.ensure_future(coro)
+        loop = asyncio.get_running_loop()
+
+        def cancel_task():
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                pass  # Loop already closed; the task is gone with it
+
+        self.add_callback(cancel_task)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if self.cancelled:
+                raise ScrapeCancelled(self.reason)
+            raise
+        finally:
+            self.remove_callback(cancel_task)
+
+
+_tokens = {}
+_tokens_lock = threading.Lock()
+
+
+def register_scrape(session_id):
+    """Create (or return) the cancellation token for a session"""
+    with _tokens_lock:
+        return _tokens.setdefault(session_id, CancellationToken())
+
+
+def get_token(session_id):
+    with _tokens_lock:
+        return _tokens.get(session_id)
+
+
+def active_scrapes():
+    """Number of scrapes running or queued"""
+    with _tokens_lock:
+        return len(_tokens)
+
+
+def release_scrape(session_id):
+    with _tokens_lock:
+        _tokens.pop(session_id, None)
+
+
+def cancel_scrape(session_id, reason=CANCEL_REQUESTED):
+    """Cancel a running or queued scrape; returns False if none is active"""
+    token = get_token(session_id)
+    if token is None:
+        return False
+    token.cancel(reason)
+    return True
@@ -0,0 +1,71 @@
+import re
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+from schemas import UrlRules
+
+# Query parameters that never change page content
+TRACKING_PARAMS = {
+    "_ga",
+    "_gl",
+    "dclid",
+    "fbclid",
+    "gclid",
+    "gclsrc",
+    "igshid",
+    "mc_cid",
+    "mc_eid",
+    "msclkid",
+    "ref",
+    "ref_src",
+    "srsltid",
+    "yclid",
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "hsa_")
+
+LOCALE_SEGMENT_RE = re.compile(r"^[a-z]{2}(?:[-_][a-z]{2})?$", re.IGNORECASE)
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+
+def _keep_param(name, rules):
+    lowered = name.lower()
+    if rules.keep_params is not None:
+        return lowered in {param.lower() for param in rules.keep_params}
+    if lowered in TRACKING_PARAMS or lowered.startswith(TRACKING_PREFIXES):
+        return False
+    return lowered not in {param.lower() for param in rules.strip_params}
+
+
+def canonicalize_url(url, rules=None):
+    """Normalize a product URL so trivially different spellings compare equal.
+
+    Always lowercases scheme and host, drops default ports, fragments and
+    tracking parameters, and sorts the query. Per-store rules can also strip
+    extra (variant) parameters, keep only an allow-list of parameters,
+    lowercase the path, drop trailing slashes and drop a leading locale
+    segment such as /en-gb/.
+    """
+    rules = rules or UrlRules()
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+
+    netloc = parsed.netloc.lower()
+    host, _, port = netloc.rpartition(":")
+    if host and DEFAULT_PORTS.get(scheme) == port:
+        netloc = host
+
+    path = parsed.path or "/"
+    if rules.strip_locale_prefix:
+        segments = path.split("/")
+        if len(segments) > 2 and LOCALE_SEGMENT_RE.match(segments[1]):
+            path = "/" + "/".join(segments[2:])
+    if rules.lowercase_path:
+        path = path.lower()
+    if rules.strip_trailing_slash and len(path) > 1:
+        path = path.rstrip("/") or "/"
+
+    params = sorted(
+        (name, value)
+        for name, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if _keep_param(name, rules)
+    )
+    return urlunparse((scheme, netloc, path, "", urlencode(params), ""))
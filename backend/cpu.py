@@ -0,0 +1,53 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from scheduler import FairScheduler
+
+# Processes for CPU-bound parsing; 0 runs that work inline on the calling thread
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", os.cpu_count() or 2))
+# Documents queued or in flight per worker process; callers beyond this wait,
+# which keeps memory bounded when fetching outpaces parsing
+CPU_QUEUE_DEPTH = 2
+
+# Shares the process pool fairly between stores, like fetch and LLM capacity
+cpu_scheduler = FairScheduler("cpu", max(1, CPU_WORKERS) * CPU_QUEUE_DEPTH)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_cpu_executor():
+    """The shared process pool, started on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn, not fork: forking a process full of threads can copy held locks
+            _executor = ProcessPoolExecutor(
+                max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def shutdown_cpu_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+async def run_cpu(fn, *args, store=""):
+    """Run fn(*args) in the process pool once a slot frees up.
+
+    fn must be a module-level function (or a picklable bound method); its
+    arguments and result are pickled, so pass the raw document once and
+    return only what the caller needs.
+    """
+    async with cpu_scheduler.slot_async(store):
+        if CPU_WORKERS == 0:
+            return fn(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_cpu_executor(), fn, *args)
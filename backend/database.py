@@ -1,11 +1,18 @@
-from sqlalchemy import create_engine, event
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import declarative_base, sessionmaker
 from sqlalchemy.engine import Engine
 import sqlite3
 
+DATABASE_PATH = os.getenv("DATABASE_PATH", "grocery_ghost.db")
+
 # Optimized SQLite configuration for performance and to prevent locking
 engine = create_engine(
-    "sqlite:///grocery_ghost.db",
+    f"sqlite:///{DATABASE_PATH}",
     echo=False,  # Set to True for debugging SQL queries
     pool_pre_ping=True,  # Verify connections before use
     pool_recycle=300,  # Recycle connections every 5 minutes
@@ -30,12 +37,56 @@ def set_sqlite_pragma(dbapi_connection, connection_record):
         cursor.execute("PRAGMA mmap_size=268435456")  # Use memory mapping (256MB)
         cursor.execute("PRAGMA busy_timeout=60000")  # 60 second busy timeout
         cursor.execute("PRAGMA wal_autocheckpoint=1000")  # Auto-checkpoint every 1000 pages
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")  # Lets maintenance free pages in chunks (new files)
         cursor.execute("PRAGMA optimize")  # Optimize the database
         cursor.close()
 
 Base = declarative_base()
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+# Bounded pools so blocking database work never runs on the event loop.
+# Exports get their own pool so a long export can't starve interactive queries.
+DB_WORKERS = 8
+EXPORT_WORKERS = 2
+db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+export_executor = ThreadPoolExecutor(
+    max_workers=EXPORT_WORKERS, thread_name_prefix="db-export"
+)
+
+# Large deletes commit a chunk at a time so scrapes never wait long on the write lock
+DELETE_CHUNK = 2000
+DELETE_PAUSE = 0.05  # Seconds between chunks, for other writers to get in
+
+
+async def run_db(fn, *args, executor=db_executor):
+    """Run fn(db, *args) with its own session on a bounded database thread pool"""
+
+    def call():
+        db = SessionLocal()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    return await asyncio.get_running_loop().run_in_executor(executor, call)
+
+
+def delete_in_chunks(db, table, session_id, chunk=DELETE_CHUNK, pause=DELETE_PAUSE):
+    """Delete a session's rows from table, one committed chunk at a time; returns the count"""
+    statement = text(f"""
+        DELETE FROM {table} WHERE rowid IN (
+            SELECT rowid FROM {table} WHERE session_id = :session_id LIMIT :chunk
+        )
+    """)
+    deleted = 0
+    while True:
+        count = db.execute(statement, {"session_id": session_id, "chunk": chunk}).rowcount
+        db.commit()
+        deleted += count
+        if count < chunk:
+            return deleted
+        time.sleep(pause)
+
 
 def get_db():
     db = SessionLocal()
@@ -43,3 +94,42 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def ensure_schema():
+    """Create missing tables and add columns introduced after a table was created.
+
+    create_all never alters existing tables, so new columns are added with
+    ALTER TABLE. Only nullable columns can be added this way. Indexes
+    declared after a table was created are left to ensure_indexes, since
+    building them on a large table takes too long for startup.
+    """
+    Base.metadata.create_all(bind=engine)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(
+                    text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+                )
+
+
+def ensure_indexes():
+    """Create indexes declared after their table was created; run off the startup path.
+
+    Each index is built in its own transaction, so writers wait for one
+    index at a time rather than for all of them.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            print(f"Building index {index.name} on {table.name}")
+            with engine.begin() as conn:
+                index.create(bind=conn, checkfirst=True)
@@ -0,0 +1,88 @@
+import hashlib
+import re
+import threading
+from concurrent.futures import Future
+
+# Pages whose SimHash differs in at most this many of 64 bits count as duplicates
+SIMHASH_MAX_DISTANCE = 3
+# The fingerprint is split into this many bands for lookup; two fingerprints
+# within SIMHASH_MAX_DISTANCE bits always agree on at least one whole band
+SIMHASH_BANDS = 4
+SHINGLE_WORDS = 3
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_BAND_BITS = 64 // SIMHASH_BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+def simhash(text):
+    """64-bit SimHash over word shingles of cleaned page text"""
+    words = _WORD_RE.findall(text.casefold())
+    if len(words) < SHINGLE_WORDS:
+        shingles = [" ".join(words)] if words else []
+    else:
+        shingles = [
+            " ".join(words[i : i + SHINGLE_WORDS])
+            for i in range(len(words) - SHINGLE_WORDS + 1)
+        ]
+
+    weights = [0] * 64
+    for shingle in shingles:
+        value = _hash64(shingle)
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+def _bands(fingerprint):
+    return [
+        (band, fingerprint >> (band * _BAND_BITS) & _BAND_MASK)
+        for band in range(SIMHASH_BANDS)
+    ]
+
+
+class NearDuplicateIndex:
+    """Extraction results for one scrape, keyed by page SimHash.
+
+    The first page with a given fingerprint claims it and runs extraction;
+    pages within SIMHASH_MAX_DISTANCE bits get that page's future and wait
+    for its result instead of extracting again. Futures are thread-safe, so
+    page workers on different threads and event loops share the index.
+    """
+
+    def __init__(self, max_distance=SIMHASH_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.duplicates = 0
+        self._entries = []  # (fingerprint, url, future)
+        self._buckets = {}  # (band, value) -> entry indexes
+        self._lock = threading.Lock()
+
+    def claim(self, fingerprint, url):
+        """Return (future, owner_url, is_owner) for a page fingerprint.
+
+        When is_owner is True the caller must resolve the future with its
+        extraction result (or None) once done; otherwise owner_url is the
+        near-duplicate page whose result the future will carry.
+        """
+        with self._lock:
+            for key in _bands(fingerprint):
+                for index in self._buckets.get(key, ()):
+                    known, owner_url, future = self._entries[index]
+                    if hamming_distance(known, fingerprint) <= self.max_distance:
+                        self.duplicates += 1
+                        return future, owner_url, False
+
+            future = Future()
+            index = len(self._entries)
+            self._entries.append((fingerprint, url, future))
+            for key in _bands(fingerprint):
+                self._buckets.setdefault(key, []).append(index)
+            return future, url, True
@@ -1,16 +1,43 @@
+import threading
 from contextlib import asynccontextmanager
 
+import anyio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from database import Base, engine
+from analytics import backfill_analytics
+from cpu import shutdown_cpu_executor
+from database import SessionLocal, ensure_indexes, ensure_schema
+from retention import janitor
 from routes import router
 
+# Threads available to sync route handlers (FastAPI's request threadpool)
+REQUEST_THREADS = 32
+
+
+def run_migrations():
+    db = SessionLocal()
+    try:
+        ensure_indexes()
+        backfill_analytics(db)
+    except Exception as e:
+        print(f"Background migration failed: {e}")
+    finally:
+        db.close()
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    Base.metadata.create_all(bind=engine)
+    anyio.to_thread.current_default_thread_limiter().total_tokens = REQUEST_THREADS
+    ensure_schema()
+    # New indexes are built, and products saved before analytics existed get keys
+    # and aggregates, in the background
+    threading.Thread(target=run_migrations, name="migrations", daemon=True).start()
+    # Background deletes, retention sweeps and idle database maintenance
+    janitor.start()
     yield
+    janitor.stop()
+    shutdown_cpu_executor()
 
 
 app = FastAPI(lifespan=lifespan)
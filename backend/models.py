@@ -3,8 +3,10 @@ from datetime import datetime, timezone
 from uuid import uuid4
 
 from sqlalchemy import (
+    Boolean,
     DateTime,
     Enum,
+    Float,
     ForeignKey,
     Integer,
     String,
@@ -21,6 +23,7 @@ class SessionStatus(enum.Enum):
     COMPLETED = "completed"
     FAILED = "failed"
     CANCELED = "canceled"
+    DELETING = "deleting"  # Hidden; its rows are being deleted in the background
 
 
 class ScrapeSession(Base):
@@ -41,6 +44,7 @@ class ScrapeSession(Base):
     )
     completed_at: Mapped[datetime | None] = mapped_column(DateTime)
     error: Mapped[str | None] = mapped_column(Text)  # Use Text for longer error messages
+    stop_reason: Mapped[str | None] = mapped_column(String)  # Why the scrape stopped
 
     # Performance indexes
     __table_args__ = (
@@ -66,6 +70,8 @@ class Product(Base):
     image_url: Mapped[str | None] = mapped_column(Text)  # URLs can be long
     category: Mapped[str | None] = mapped_column(String, index=True)  # Index for filtering
     dietary_tags: Mapped[str | None] = mapped_column(String)
+    price_value: Mapped[float | None] = mapped_column(Float)  # current_price parsed to a number
+    product_key: Mapped[str | None] = mapped_column(String)  # Normalized URL; same product across sessions
 
     # Performance indexes for common queries
     __table_args__ = (
@@ -73,4 +79,71 @@ class Product(Base):
         Index('idx_products_name', name),
         Index('idx_products_category', category),
         Index('idx_products_session_category', session_id, category),  # Composite index
+        Index('idx_products_session_key', session_id, product_key),  # Session diffs
+        Index('idx_products_session_price', session_id, price_value),  # Median price
     )
+
+
+class PageSnapshot(Base):
+    """A fetched page archived in the snapshot store, for offline re-extraction"""
+
+    __tablename__ = "page_snapshots"
+
+    id: Mapped[str] = mapped_column(
+        String, primary_key=True, default=lambda: str(uuid4())
+    )
+    session_id: Mapped[str] = mapped_column(
+        String, ForeignKey("sessions.id"), nullable=False, index=True
+    )
+    url: Mapped[str] = mapped_column(String, nullable=False)
+    content_hash: Mapped[str] = mapped_column(String, nullable=False, index=True)
+    encoding: Mapped[str | None] = mapped_column(String)
+    fetched_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc)
+    )
+
+
+class Store(Base):
+    """What is known about a store between scrapes, keyed by its lowercased netloc"""
+
+    __tablename__ = "stores"
+
+    netloc: Mapped[str] = mapped_column(String, primary_key=True)
+    base_url: Mapped[str] = mapped_column(String, nullable=False)
+    name: Mapped[str | None] = mapped_column(String)
+    aliases: Mapped[str | None] = mapped_column(Text)  # JSON list of hosts that redirect here
+    sitemap_urls: Mapped[str | None] = mapped_column(Text)  # JSON list of working sitemaps
+    url_patterns: Mapped[str | None] = mapped_column(Text)  # JSON list of product path prefixes
+    url_rules: Mapped[str | None] = mapped_column(Text)  # UrlRules JSON
+    sticky_proxy: Mapped[bool | None] = mapped_column(Boolean)
+    validated_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc)
+    )
+    discovered_at: Mapped[datetime | None] = mapped_column(DateTime)
+
+
+class SessionStats(Base):
+    """Running per-session aggregates, updated as each product batch is inserted"""
+
+    __tablename__ = "session_stats"
+
+    session_id: Mapped[str] = mapped_column(
+        String, ForeignKey("sessions.id"), primary_key=True
+    )
+    product_count: Mapped[int] = mapped_column(Integer, default=0)
+    priced_count: Mapped[int] = mapped_column(Integer, default=0)
+    price_min: Mapped[float | None] = mapped_column(Float)
+    price_max: Mapped[float | None] = mapped_column(Float)
+    discount_count: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class SessionCategory(Base):
+    """Running product count per category of a session ("" for uncategorized)"""
+
+    __tablename__ = "session_categories"
+
+    session_id: Mapped[str] = mapped_column(
+        String, ForeignKey("sessions.id"), primary_key=True
+    )
+    category: Mapped[str] = mapped_column(String, primary_key=True)
+    product_count: Mapped[int] = mapped_column(Integer, default=0)
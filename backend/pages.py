@@ -0,0 +1,200 @@
+import json
+import re
+import zlib
+
+from bs4 import BeautifulSoup
+
+from fingerprints import simhash
+from schemas import ProductSchema
+
+# Largest decoded page body read; anything beyond is never downloaded
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+PAGE_CHUNK_BYTES = 64 * 1024
+# Encodings we can decode incrementally while counting wire bytes
+ACCEPT_ENCODING = "gzip, deflate"
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+
+LD_JSON_RE = re.compile(
+    rb"<script[^>]*application/ld\+json[^>]*>(.*?)</script\s*>", re.IGNORECASE | re.DOTALL
+)
+SCRIPT_OPEN = b"<script"
+CURRENCY_SYMBOLS = {"USD": "$", "EUR": "€", "GBP": "£", "JPY": "¥", "INR": "₹"}
+
+
+class SkippedPage(Exception):
+    """The response is not a page worth reading (e.g. not HTML)"""
+
+
+class StreamedPage:
+    """A page body read by read_page"""
+
+    def __init__(self, content, wire_bytes, truncated, jsonld_product):
+        self.content = content
+        self.wire_bytes = wire_bytes
+        self.truncated = truncated
+        self.jsonld_product = jsonld_product  # The JSON-LD Product block read stopped at
+
+
+def _decoder(content_encoding):
+    encoding = content_encoding.strip().lower()
+    if encoding in ("", "identity"):
+        return None
+    if encoding in ("gzip", "x-gzip"):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        return "deflate"  # zlib-wrapped or raw; decided on the first chunk
+    raise SkippedPage(f"unsupported Content-Encoding {content_encoding!r}")
+
+
+def _is_html(content_type):
+    return not content_type or content_type.split(";")[0].strip().lower() in HTML_CONTENT_TYPES
+
+
+def _jsonld_nodes(data):
+    if isinstance(data, list):
+        for item in data:
+            yield from _jsonld_nodes(item)
+    elif isinstance(data, dict):
+        yield data
+        for key in ("@graph", "mainEntity"):
+            if key in data:
+                yield from _jsonld_nodes(data[key])
+
+
+def _is_product(node):
+    types = node.get("@type")
+    types = types if isinstance(types, list) else [types]
+    return any(str(t).rsplit("/", 1)[-1].lower() == "product" for t in types)
+
+
+def _first(value):
+    if isinstance(value, list):
+        return _first(value[0]) if value else None
+    return value
+
+
+def _offer_price(offers):
+    offer = _first(offers)
+    if not isinstance(offer, dict):
+        return None
+    price = offer.get("price", offer.get("lowPrice"))
+    if price in (None, ""):
+        return None
+    currency = str(offer.get("priceCurrency") or "").upper()
+    symbol = CURRENCY_SYMBOLS.get(currency)
+    if symbol:
+        return f"{symbol}{price}"
+    return f"{price} {currency}".strip()
+
+
+def find_jsonld_product(blocks):
+    """First complete JSON-LD Product (with a name and a price) among script bodies"""
+    for block in blocks:
+        try:
+            data = json.loads(block)
+        except ValueError:
+            continue
+        for node in _jsonld_nodes(data):
+            if _is_product(node) and node.get("name") and _offer_price(node.get("offers")):
+                return node
+    return None
+
+
+def jsonld_product_in(content):
+    """The JSON-LD Product node of a page body (bytes), or None"""
+    return find_jsonld_product(match.group(1) for match in LD_JSON_RE.finditer(content))
+
+
+def product_from_jsonld(node, url):
+    """Map a schema.org Product node to a ProductSchema"""
+    image = _first(node.get("image"))
+    if isinstance(image, dict):
+        image = image.get("url")
+    category = _first(node.get("category"))
+    if isinstance(category, dict):
+        category = category.get("name")
+    size = node.get("size")
+    return ProductSchema(
+        url=url,
+        name=str(node["name"]).strip(),
+        current_price=_offer_price(node.get("offers")),
+        unit_size=str(size) if isinstance(size, (str, int, float)) else None,
+        category=str(category).rsplit(">", 1)[-1].strip() if category else None,
+        image_url=str(image) if image else None,
+    )
+
+
+def clean_page_text(html):
+    """Visible text of a page, one block per line; what the LLM is shown"""
+    soup = BeautifulSoup(html, "html.parser")
+    return soup.get_text(separator="\n", strip=True)
+
+
+def page_text_and_fingerprint(html):
+    """Clean text plus its SimHash, computed together in one process pool call"""
+    text = clean_page_text(html)
+    return text, simhash(text)
+
+
+def read_page(response, token=None, max_bytes=MAX_PAGE_BYTES, early_exit=True):
+    """Stream an HTML response body with a size cap and early exit.
+
+    Checks the content type before any of the body is read, decompresses
+    gzip/deflate as it arrives (counting wire bytes for proxy billing),
+    stops at max_bytes decoded bytes, and stops as soon as a complete
+    JSON-LD Product block has arrived, since everything needed is in it.
+    With early_exit=False (pages being archived) the block is still found
+    but the whole body is read. Raises SkippedPage for responses that
+    aren't HTML.
+    """
+    content_type = response.headers.get("Content-Type", "")
+    if not _is_html(content_type):
+        raise SkippedPage(f"not HTML ({content_type})")
+    decoder = _decoder(response.headers.get("Content-Encoding", ""))
+
+    body = bytearray()
+    wire_bytes = 0
+    truncated = False
+    scan_from = 0
+    product = None
+
+    while len(body) < max_bytes:
+        # read1 returns whatever has arrived instead of blocking for a full chunk
+        chunk = response.raw.read1(PAGE_CHUNK_BYTES, decode_content=False)
+        if token:
+            token.raise_if_cancelled()
+        if not chunk:
+            break
+        wire_bytes += len(chunk)
+
+        if decoder == "deflate":
+            # "deflate" is meant to be zlib-wrapped, but some servers send it raw
+            wrapped = len(chunk) > 1 and chunk[0] & 0x0F == 8 and (chunk[0] << 8 | chunk[1]) % 31 == 0
+            decoder = zlib.decompressobj(zlib.MAX_WBITS if wrapped else -zlib.MAX_WBITS)
+        if decoder is not None:
+            # Bounded output, so a compression bomb can't exceed max_bytes
+            chunk = decoder.decompress(chunk, max_bytes - len(body) + 1)
+        body += chunk
+        if product is not None:
+            continue  # Reading on for the archive
+
+        blocks = []
+        for match in LD_JSON_RE.finditer(body, scan_from):
+            blocks.append(match.group(1))
+            scan_from = match.end()
+        product = find_jsonld_product(blocks)
+        if product is not None:
+            if early_exit:
+                break
+            continue
+        # Resume at a script that may still be arriving
+        pending = body.rfind(SCRIPT_OPEN, scan_from)
+        scan_from = pending if pending != -1 else max(scan_from, len(body) - len(SCRIPT_OPEN))
+
+    stopped_early = product is not None and early_exit
+    if hasattr(decoder, "flush") and not stopped_early and len(body) < max_bytes:
+        body += decoder.flush()
+    if len(body) >= max_bytes:
+        truncated = True
+        del body[max_bytes:]
+    return StreamedPage(bytes(body), wire_bytes, truncated, product)
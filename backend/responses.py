@@ -0,0 +1,77 @@
+import orjson
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+
+from database import SessionLocal
+
+# Columns selected for product listings, in the order the rows are unpacked
+PRODUCT_COLUMNS = (
+    "id",
+    "name",
+    "current_price",
+    "original_price",
+    "unit_size",
+    "category",
+    "url",
+    "image_url",
+    "dietary_tags",
+)
+PRODUCT_SELECT = ", ".join(PRODUCT_COLUMNS)
+_TAGS_INDEX = PRODUCT_COLUMNS.index("dietary_tags")
+
+# Product lists longer than this are streamed in chunks instead of encoded at once
+STREAM_THRESHOLD = 500
+STREAM_CHUNK_ROWS = 250
+
+
+def product_dict(row):
+    """Map a raw product row (selected with PRODUCT_SELECT) to its JSON shape"""
+    product = dict(zip(PRODUCT_COLUMNS, row))
+    tags = row[_TAGS_INDEX]
+    product["dietary_tags"] = tags.split(",") if tags else []
+    return product
+
+
+def json_response(payload, status_code=200):
+    """Encode payload with orjson, bypassing FastAPI's jsonable_encoder pass"""
+    return Response(
+        content=orjson.dumps(payload),
+        status_code=status_code,
+        media_type="application/json",
+    )
+
+
+def products_response(payload, rows):
+    """Respond with payload plus a "products" list encoded straight from raw rows"""
+    payload["products"] = [product_dict(row) for row in rows]
+    return json_response(payload)
+
+
+def _stream_products(payload, query, params):
+    # The stream outlives the request's session, so it reads through its own
+    db = SessionLocal()
+    try:
+        result = db.execute(query, params)
+        yield b'{"products":['
+        first = True
+        while rows := result.fetchmany(STREAM_CHUNK_ROWS):
+            chunk = b",".join(orjson.dumps(product_dict(row)) for row in rows)
+            yield chunk if first else b"," + chunk
+            first = False
+    finally:
+        db.close()
+
+    rest = orjson.dumps(payload)
+    # Splice the remaining keys in after the products array
+    yield b"]}" if rest == b"{}" else b"]," + rest[1:]
+
+
+def stream_products_response(payload, query, params):
+    """Like products_response, but rows are fetched and encoded chunk by chunk.
+
+    Neither the result set nor the encoded body is ever held in memory whole,
+    so use it for listings above STREAM_THRESHOLD rows.
+    """
+    return StreamingResponse(
+        _stream_products(payload, query, params), media_type="application/json"
+    )
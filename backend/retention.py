@@ -0,0 +1,368 @@
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import text
+
+from cancellation import active_scrapes, get_token
+from database import SessionLocal, delete_in_chunks, engine
+from models import (
+    Product,
+    ScrapeSession,
+    SessionCategory,
+    SessionStats,
+    SessionStatus,
+)
+from snapshots import delete_session_snapshots
+
+# Retention policy: a finished session expires once it is neither one of the
+# newest RETENTION_KEEP_SESSIONS of its store nor younger than
+# RETENTION_MAX_AGE_DAYS. 0 turns a limit off; with both off nothing expires.
+RETENTION_KEEP_SESSIONS = int(os.getenv("RETENTION_KEEP_SESSIONS", "0"))
+RETENTION_MAX_AGE_DAYS = float(os.getenv("RETENTION_MAX_AGE_DAYS", "0"))
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", "6"))
+# Expired sessions are written here as Parquet before deletion (empty: delete only)
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_BATCH_ROWS = 10000  # Products read and written per Parquet row group
+ARCHIVE_COMPRESSION = "zstd"
+IDLE_CHECK_SECONDS = 60  # How often the janitor looks for housekeeping when no deletes are queued
+PURGE_RETRY_SECONDS = 1  # Wait for a deleted session's scrape to wind down before purging it
+# Database maintenance runs at most this often, and only with no scrapes or deletes running
+MAINTENANCE_INTERVAL_HOURS = float(os.getenv("MAINTENANCE_INTERVAL_HOURS", "24"))
+VACUUM_FREE_SHARE = 0.1  # Free share of the file worth converting to incremental vacuum for
+VACUUM_CHUNK_PAGES = 2000  # Pages returned to the filesystem per incremental vacuum step
+
+FINISHED_STATUSES = (SessionStatus.COMPLETED, SessionStatus.FAILED, SessionStatus.CANCELED)
+SESSION_FIELDS = (
+    "id", "url", "name", "status", "total_pages", "scraped_pages",
+    "started_at", "completed_at", "error", "stop_reason",
+)
+ARCHIVE_SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("url", pa.string()),
+        ("name", pa.string()),
+        ("current_price", pa.string()),
+        ("original_price", pa.string()),
+        ("unit_size", pa.string()),
+        ("image_url", pa.string()),
+        ("category", pa.string()),
+        ("dietary_tags", pa.string()),
+        ("price_value", pa.float64()),
+        ("product_key", pa.string()),
+    ]
+)
+
+
+def store_of(url):
+    return urlparse(url).netloc.lower()
+
+
+def expired_sessions(db, now=None, keep=None, max_age_days=None):
+    """Ids of finished sessions the retention policy no longer keeps, oldest first"""
+    keep = RETENTION_KEEP_SESSIONS if keep is None else keep
+    max_age_days = RETENTION_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    if not keep and not max_age_days:
+        return []
+    now = now or datetime.now(timezone.utc)
+    cutoff = (now - timedelta(days=max_age_days)).replace(tzinfo=None)  # SQLite drops the offset
+    rows = (
+        db.query(ScrapeSession.id, ScrapeSession.url, ScrapeSession.started_at)
+        .filter(ScrapeSession.status.in_(FINISHED_STATUSES))
+        .order_by(ScrapeSession.started_at.desc())
+        .all()
+    )
+    kept_per_store = {}
+    expired = []
+    for session_id, url, started_at in rows:
+        store = store_of(url)
+        rank = kept_per_store.get(store, 0)
+        kept_per_store[store] = rank + 1
+        within_count = keep and rank < keep
+        within_age = max_age_days and started_at.replace(tzinfo=None) >= cutoff
+        if not within_count and not within_age:
+            expired.append(session_id)
+    return expired[::-1]
+
+
+def archive_path(root, session):
+    return os.path.join(root, store_of(session.url) or "unknown", f"{session.id}.parquet")
+
+
+def archive_session(db, session_id, root=ARCHIVE_DIR):
+    """Write a session's products to a zstd Parquet file; returns its path.
+
+    The session row (and its aggregates) are kept as JSON in the file's
+    "session" metadata, so pq.read_table(path) restores everything the
+    database held. The file is written under a temporary name and renamed,
+    so a crash never leaves a truncated archive behind.
+    """
+    session = db.get(ScrapeSession, session_id)
+    path = archive_path(root, session)
+    metadata = {field: getattr(session, field) for field in SESSION_FIELDS}
+    metadata["status"] = session.status.value
+    stats = db.get(SessionStats, session_id)
+    if stats is not None:
+        metadata["stats"] = {
+            "product_count": stats.product_count,
+            "priced_count": stats.priced_count,
+            "price_min": stats.price_min,
+            "price_max": stats.price_max,
+            "discount_count": stats.discount_count,
+        }
+    schema = ARCHIVE_SCHEMA.with_metadata({"session": json.dumps(metadata, default=str)})
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.tmp"
+    result = db.execute(
+        text(f"""
+            SELECT {", ".join(ARCHIVE_SCHEMA.names)} FROM products
+            WHERE session_id = :session_id
+        """),
+        {"session_id": session_id},
+    )
+    with pq.ParquetWriter(temporary, schema, compression=ARCHIVE_COMPRESSION) as writer:
+        while rows := result.fetchmany(ARCHIVE_BATCH_ROWS):
+            columns = list(zip(*rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema,
+            ))
+    os.replace(temporary, path)
+    return path
+
+
+def purge_session(db, session_id):
+    """Delete a session and everything it owns, one committed chunk at a time"""
+    delete_session_snapshots(db, session_id)
+    for model in (Product, SessionCategory, SessionStats):
+        delete_in_chunks(db, model.__tablename__, session_id)
+    db.query(ScrapeSession).filter(ScrapeSession.id == session_id).delete()
+    db.commit()
+
+
+def _pragma(conn, statement):
+    result = conn.exec_driver_sql(f"PRAGMA {statement}")
+    return result.scalar() if result.returns_rows else None
+
+
+def _autocommit():
+    return engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def maintain_database(idle):
+    """Refresh planner statistics and return free pages to the filesystem.
+
+    Pages are released VACUUM_CHUNK_PAGES at a time with idle() checked
+    before every step, so a starting scrape waits for one step at most.
+    Files created before incremental auto-vacuum was enabled can't free
+    pages this way; converting them takes a full VACUUM that holds the
+    write lock for the whole rewrite, so it is never run here but
+    scheduled by an operator with `python -m retention vacuum`.
+    """
+    with _autocommit() as conn:
+        _pragma(conn, "optimize")
+        free = _pragma(conn, "freelist_count")
+        if _pragma(conn, "auto_vacuum") != 2:  # 2 = incremental
+            if free and free >= _pragma(conn, "page_count") * VACUUM_FREE_SHARE:
+                print(
+                    f"{free} free database pages can't be reclaimed until the file is "
+                    "converted; schedule `python -m retention vacuum` during downtime"
+                )
+        else:
+            while free and idle():
+                _pragma(conn, f"incremental_vacuum({VACUUM_CHUNK_PAGES})")
+                free = _pragma(conn, "freelist_count")
+        _pragma(conn, "wal_checkpoint(TRUNCATE)")
+
+
+def vacuum_database():
+    """Rewrite the database with a full VACUUM, switching it to incremental auto-vacuum.
+
+    Holds the write lock for the whole rewrite (minutes on a large file):
+    run it with the API stopped or in a quiet window, not from the server.
+    """
+    with _autocommit() as conn:
+        free = _pragma(conn, "freelist_count")
+        print(f"Vacuuming the database to reclaim {free} free pages")
+        _pragma(conn, "auto_vacuum=INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+        _pragma(conn, "wal_checkpoint(TRUNCATE)")
+
+
+class Janitor:
+    """Background thread that deletes sessions and applies the retention policy.
+
+    Deletions queue here instead of running in a request, and are carried
+    out a chunk per transaction. Between deletions it sweeps for expired
+    sessions every RETENTION_INTERVAL_HOURS and, when no scrape or delete
+    is running, maintains the database.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._last_sweep = None
+        self._last_maintenance = None
+        self.deleted = 0
+        self.archived = 0
+        self.last_sweep_at = None
+        self.last_maintenance_at = None
+
+    def start(self):
+        """Start the thread, resuming deletions interrupted by a restart"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        # Maintenance waits a full interval rather than vacuuming at boot
+        self._last_maintenance = time.monotonic()
+        db = SessionLocal()
+        try:
+            interrupted = [
+                row.id
+                for row in db.query(ScrapeSession.id).filter(
+                    ScrapeSession.status == SessionStatus.DELETING
+                )
+            ]
+        finally:
+            db.close()
+        for session_id in interrupted:
+            self.delete(session_id)
+        self._thread = threading.Thread(target=self._run, name="janitor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._queue.put(None)
+        if self._thread:
+            self._thread.join(timeout)
+
+    def delete(self, session_id):
+        """Queue a session (already marked DELETING) for background deletion"""
+        with self._lock:
+            if session_id in self._pending:
+                return
+            self._pending.add(session_id)
+            self._idle.clear()
+        self._queue.put(session_id)
+
+    def idle(self):
+        with self._lock:
+            pending = bool(self._pending)
+        return not pending and not active_scrapes()
+
+    def wait(self, timeout=None):
+        """Block until every queued deletion has finished; False on timeout"""
+        return self._idle.wait(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                session_id = self._queue.get(timeout=IDLE_CHECK_SECONDS)
+            except queue.Empty:
+                self._housekeeping()
+                continue
+            if session_id is None:
+                continue
+            if get_token(session_id) is not None:
+                # Its scrape is still stopping; deleting now could orphan its last batch
+                time.sleep(PURGE_RETRY_SECONDS)
+                self._queue.put(session_id)
+                continue
+            self._purge(session_id)
+
+    def _purge(self, session_id):
+        db = SessionLocal()
+        try:
+            purge_session(db, session_id)
+            self.deleted += 1
+        except Exception as e:
+            print(f"Deleting session {session_id} failed: {e}")
+        finally:
+            db.close()
+            with self._lock:
+                self._pending.discard(session_id)
+                if not self._pending:
+                    self._idle.set()
+
+    def _housekeeping(self):
+        now = time.monotonic()
+        if (RETENTION_KEEP_SESSIONS or RETENTION_MAX_AGE_DAYS) and (
+            self._last_sweep is None or now - self._last_sweep >= RETENTION_INTERVAL_HOURS * 3600
+        ):
+            self._last_sweep = now
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Retention sweep failed: {e}")
+        if self.idle() and now - self._last_maintenance >= MAINTENANCE_INTERVAL_HOURS * 3600:
+            self._last_maintenance = now
+            try:
+                maintain_database(self.idle)
+                self.last_maintenance_at = datetime.now(timezone.utc)
+            except Exception as e:
+                print(f"Database maintenance failed: {e}")
+
+    def sweep(self, archive_dir=ARCHIVE_DIR):
+        """Archive and queue deletion of every session the policy has expired"""
+        db = SessionLocal()
+        try:
+            expired = expired_sessions(db)
+            for session_id in expired:
+                if archive_dir:
+                    try:
+                        archive_session(db, session_id, archive_dir)
+                    except Exception as e:
+                        # Kept until it can be archived; retried on the next sweep
+                        print(f"Archiving session {session_id} failed: {e}")
+                        continue
+                    self.archived += 1
+                db.query(ScrapeSession).filter(ScrapeSession.id == session_id).update(
+                    {ScrapeSession.status: SessionStatus.DELETING}
+                )
+                db.commit()
+                self.delete(session_id)
+        finally:
+            db.close()
+        self.last_sweep_at = datetime.now(timezone.utc)
+        if expired:
+            print(f"Retention expired {len(expired)} sessions")
+        return expired
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "policy": {
+                "keep_sessions_per_store": RETENTION_KEEP_SESSIONS or None,
+                "max_age_days": RETENTION_MAX_AGE_DAYS or None,
+                "archive_dir": ARCHIVE_DIR or None,
+            },
+            "pending_deletions": pending,
+            "sessions_deleted": self.deleted,
+            "sessions_archived": self.archived,
+            "last_sweep_at": self.last_sweep_at,
+            "last_maintenance_at": self.last_maintenance_at,
+        }
+
+
+janitor = Janitor()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] != ["vacuum"]:
+        sys.exit("usage: python -m retention vacuum")
+    vacuum_database()
@@ -1,19 +1,42 @@
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import func, text
+from datetime import datetime, timezone
+from urllib.parse import urlparse
 import csv
 import io
-from concurrent.futures import ThreadPoolExecutor
 
-from database import get_db
-from models import Product, ScrapeSession, SessionStatus
-from schemas import ScrapeRequest
-from scraper import validate_url, scrape_store
+from analytics import DIFF_LIMIT, session_analytics, session_diff
+from budget import STOP_CANCELED, ScrapeBudget
+from cancellation import CANCEL_DELETED, cancel_scrape, register_scrape
+from database import export_executor, get_db, run_db
+from models import PageSnapshot, Product, ScrapeSession, SessionStatus
+from proxies import proxy_pool
+from retention import janitor
+from responses import (
+    PRODUCT_SELECT,
+    STREAM_THRESHOLD,
+    json_response,
+    products_response,
+    stream_products_response,
+)
+from routing import page_router
+from schemas import BatchScrapeRequest, ScrapeLimits, ScrapeRequest
+from scheduler import fetch_scheduler, llm_scheduler
+from scraper import (
+    reextract_session,
+    resolve_store,
+    scrape_executor,
+    scrape_store,
+    validate_and_scrape,
+)
+from snapshots import ARCHIVE_PAGES_DEFAULT
 
 router = APIRouter()
 
-# Thread pool for database operations
-executor = ThreadPoolExecutor(max_workers=4)
+# Handlers that only touch the database are plain `def`, so FastAPI runs them
+# in its threadpool and blocking SQLAlchemy calls never stall the event loop.
+# Async handlers offload their database work through run_db.
 
 # Status mapping for SQLite enum values to frontend expected values
 STATUS_MAPPING = {
@@ -21,32 +44,162 @@ STATUS_MAPPING = {
     "IN_PROGRESS": "in_progress", 
     "COMPLETED": "completed",
     "FAILED": "failed",
-    "CANCELED": "canceled"
+    "CANCELED": "canceled",
+    "DELETING": "deleting",
 }
 
 
+# Sessions being deleted in the background are gone as far as the API is concerned
+NOT_DELETING = ScrapeSession.status != SessionStatus.DELETING
+
+
+def archive_enabled(request):
+    if request.archive_pages is None:
+        return ARCHIVE_PAGES_DEFAULT
+    return request.archive_pages
+
+
 @router.post("/scrape")
-async def scrape(
-    request: ScrapeRequest,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-):
+async def scrape(request: ScrapeRequest):
     try:
-        base_url, netloc, name = await validate_url(str(request.url))
+        # Known stores come from the registry in milliseconds instead of re-validating
+        base_url, netloc, name, url_rules, sticky_proxy = await resolve_store(
+            str(request.url), request.url_rules, request.sticky_proxy
+        )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    new_session = ScrapeSession(url=base_url, name=name)
-    db.add(new_session)
-    db.commit()
+    def create_session(db):
+        new_session = ScrapeSession(url=base_url, name=name)
+        db.add(new_session)
+        db.commit()
+        # Plain values: the instance is detached once run_db closes the session
+        return str(new_session.id)
+
+    session_id = await run_db(create_session)
+
+    budget = ScrapeBudget.from_request(request)
+    budget.token = register_scrape(session_id)
+    # Long-running scrapes get their own pool instead of the request threadpool
+    scrape_executor.submit(
+        scrape_store,
+        session_id,
+        base_url,
+        netloc,
+        budget,
+        archive_enabled(request),
+        url_rules,
+        sticky_proxy,
+    )
+
+    return {"message": f"Scraping started for {base_url}", "session_id": session_id}
+
+
+@router.post("/scrape/batch")
+async def scrape_batch(request: BatchScrapeRequest):
+    """Queue many stores at once; validation and scraping run in the background"""
+
+    def create_sessions(db):
+        queued = []
+        for store in request.stores:
+            url = str(store.url)
+            new_session = ScrapeSession(url=url, name=urlparse(url).netloc)
+            db.add(new_session)
+            queued.append((new_session, url, store))
+        db.commit()
+        return [(str(new_session.id), url, store) for new_session, url, store in queued]
+
+    queued = await run_db(create_sessions)
+    archive = archive_enabled(request)
+
+    for session_id, url, store in queued:
+        budget = ScrapeBudget.from_request(request)
+        budget.token = register_scrape(session_id)
+        scrape_executor.submit(
+            validate_and_scrape,
+            session_id,
+            url,
+            budget,
+            store.weight,
+            archive,
+            store.url_rules,
+            store.sticky_proxy,
+        )
+
+    return {
+        "message": f"Queued {len(queued)} stores for scraping",
+        "sessions": [
+            {"session_id": session_id, "url": url}
+            for session_id, url, _ in queued
+        ],
+    }
+
+
+@router.post("/session/{session_id}/reextract")
+async def reextract(session_id: str, limits: ScrapeLimits | None = None):
+    """Re-run extraction over a session's archived pages into a new session"""
+
+    def create_session(db):
+        source = (
+            db.query(ScrapeSession)
+            .filter(ScrapeSession.id == session_id, NOT_DELETING)
+            .first()
+        )
+        if not source:
+            raise HTTPException(status_code=404, detail="Session not found")
+        snapshot_count = (
+            db.query(func.count(PageSnapshot.id))
+            .filter(PageSnapshot.session_id == session_id)
+            .scalar()
+        )
+        if not snapshot_count:
+            raise HTTPException(
+                status_code=409, detail="Session has no archived pages to re-extract"
+            )
+        new_session = ScrapeSession(
+            url=source.url, name=source.name, total_pages=snapshot_count
+        )
+        db.add(new_session)
+        db.commit()
+        # Plain values: the instance is detached once run_db closes the session
+        return str(new_session.id), snapshot_count
+
+    new_session_id, snapshot_count = await run_db(create_session)
+
+    # Without a body the whole archive is replayed
+    budget = ScrapeBudget.from_request(limits) if limits else ScrapeBudget()
+    budget.token = register_scrape(new_session_id)
+    scrape_executor.submit(reextract_session, session_id, new_session_id, budget)
+
+    return {
+        "message": f"Re-extracting {snapshot_count} archived pages",
+        "session_id": new_session_id,
+        "source_session_id": session_id,
+    }
+
+
+@router.get("/scheduler")
+async def get_scheduler_stats():
+    return {"fetch": fetch_scheduler.stats(), "llm": llm_scheduler.stats()}
+
+
+@router.get("/proxies")
+async def get_proxy_stats():
+    return proxy_pool.stats()
+
+
+@router.get("/routing")
+async def get_routing_stats():
+    return page_router.stats()
 
-    background_tasks.add_task(scrape_store, str(new_session.id), base_url, netloc)
 
-    return {"message": f"Scraping started for {base_url}", "session_id": new_session.id}
+@router.get("/retention")
+async def get_retention_stats():
+    return janitor.stats()
 
 
 @router.get("/sessions")
-async def get_sessions(db: Session = Depends(get_db)):
+def get_sessions(db: Session = Depends(get_db)):
     """Ultra-optimized sessions endpoint with single query using raw SQL"""
     try:
         # Single optimized query using raw SQL for maximum performance
@@ -61,6 +214,7 @@ async def get_sessions(db: Session = Depends(get_db)):
                 s.started_at,
                 s.completed_at,
                 s.error,
+                s.stop_reason,
                 COALESCE(p.product_count, 0) as product_count
             FROM sessions s
             LEFT JOIN (
@@ -68,6 +222,7 @@ async def get_sessions(db: Session = Depends(get_db)):
                 FROM products
                 GROUP BY session_id
             ) p ON s.id = p.session_id
+            WHERE s.status != 'DELETING'
             ORDER BY s.started_at DESC
             LIMIT 50
         """)
@@ -87,6 +242,7 @@ async def get_sessions(db: Session = Depends(get_db)):
                 "started_at": row.started_at,
                 "completed_at": row.completed_at,
                 "error": row.error,
+                "stop_reason": row.stop_reason,
                 "product_count": row.product_count,
             })
 
@@ -96,7 +252,13 @@ async def get_sessions(db: Session = Depends(get_db)):
         print(f"Sessions query error: {str(e)}")
         # Fallback to simpler query if raw SQL fails
         try:
-            sessions = db.query(ScrapeSession).order_by(ScrapeSession.started_at.desc()).limit(50).all()
+            sessions = (
+                db.query(ScrapeSession)
+                .filter(NOT_DELETING)
+                .order_by(ScrapeSession.started_at.desc())
+                .limit(50)
+                .all()
+            )
             sessions_with_counts = []
             for s in sessions:
                 product_count = db.query(func.count(Product.id)).filter(Product.session_id == s.id).scalar()
@@ -110,6 +272,7 @@ async def get_sessions(db: Session = Depends(get_db)):
                     "started_at": s.started_at,
                     "completed_at": s.completed_at,
                     "error": s.error,
+                    "stop_reason": s.stop_reason,
                     "product_count": product_count or 0,
                 })
             return {"sessions": sessions_with_counts}
@@ -118,14 +281,14 @@ async def get_sessions(db: Session = Depends(get_db)):
 
 
 @router.get("/session/{session_id}")
-async def get_session(session_id: str, db: Session = Depends(get_db)):
+def get_session(session_id: str, db: Session = Depends(get_db)):
     """Ultra-optimized session detail endpoint with efficient raw SQL"""
     try:
         # Single optimized query to get session details with product count
         session_query = text("""
             SELECT 
                 s.id, s.name, s.url, s.status, s.total_pages, s.scraped_pages,
-                s.started_at, s.completed_at, s.error,
+                s.started_at, s.completed_at, s.error, s.stop_reason,
                 COALESCE(p.product_count, 0) as product_count
             FROM sessions s
             LEFT JOIN (
@@ -133,7 +296,7 @@ async def get_session(session_id: str, db: Session = Depends(get_db)):
                 FROM products
                 GROUP BY session_id
             ) p ON s.id = p.session_id
-            WHERE s.id = :session_id
+            WHERE s.id = :session_id AND s.status != 'DELETING'
         """)
         
         session_result = db.execute(session_query, {"session_id": session_id})
@@ -146,9 +309,8 @@ async def get_session(session_id: str, db: Session = Depends(get_db)):
         
         # For performance: limit products to first 100 by default
         # This prevents slow responses for large datasets
-        products_query = text("""
-            SELECT id, name, current_price, original_price, unit_size, 
-                   category, url, image_url, dietary_tags
+        products_query = text(f"""
+            SELECT {PRODUCT_SELECT}
             FROM products 
             WHERE session_id = :session_id 
             ORDER BY name
@@ -171,22 +333,9 @@ async def get_session(session_id: str, db: Session = Depends(get_db)):
             "started_at": session_row.started_at,
             "completed_at": session_row.completed_at,
             "error": session_row.error,
+            "stop_reason": session_row.stop_reason,
             "total_products": product_count,
             "products_shown": len(products_rows),
-            "products": [
-                {
-                    "id": p.id,
-                    "name": p.name,
-                    "current_price": p.current_price,
-                    "original_price": p.original_price,
-                    "unit_size": p.unit_size,
-                    "category": p.category,
-                    "url": p.url,
-                    "image_url": p.image_url,
-                    "dietary_tags": p.dietary_tags.split(",") if p.dietary_tags else [],
-                }
-                for p in products_rows
-            ],
         }
         
         # Add pagination info if there are more products
@@ -198,7 +347,7 @@ async def get_session(session_id: str, db: Session = Depends(get_db)):
                 "message": f"Showing first {len(products_rows)} of {product_count} products for performance. Use the paginated endpoint for more."
             }
 
-        return response
+        return products_response(response, products_rows)
         
     except HTTPException:
         raise  # Re-raise HTTP exceptions
@@ -208,7 +357,7 @@ async def get_session(session_id: str, db: Session = Depends(get_db)):
 
 
 @router.get("/session/{session_id}/products")
-async def get_session_products_paginated(
+def get_session_products_paginated(
     session_id: str, 
     offset: int = 0, 
     limit: int = 100,
@@ -216,38 +365,29 @@ async def get_session_products_paginated(
 ):
     """Paginated products endpoint for large datasets"""
     try:
-        # Verify session exists
-        session = db.query(ScrapeSession).filter(ScrapeSession.id == session_id).first()
-        if not session:
+        # Verify session exists and get total count in one round trip
+        count_query = text("""
+            SELECT
+                EXISTS(
+                    SELECT 1 FROM sessions WHERE id = :session_id AND status != 'DELETING'
+                ) AS session_exists,
+                (SELECT COUNT(*) FROM products WHERE session_id = :session_id) AS total
+        """)
+        count_row = db.execute(count_query, {"session_id": session_id}).fetchone()
+        if not count_row.session_exists:
             raise HTTPException(status_code=404, detail="Session not found")
-        
-        # Get total count
-        total_count = db.query(func.count(Product.id)).filter(Product.session_id == session_id).scalar() or 0
-        
-        # Get paginated products
-        products = (
-            db.query(Product)
-            .filter(Product.session_id == session_id)
-            .offset(offset)
-            .limit(limit)
-            .all()
-        )
-        
-        return {
-            "products": [
-                {
-                    "id": p.id,
-                    "name": p.name,
-                    "current_price": p.current_price,
-                    "original_price": p.original_price,
-                    "unit_size": p.unit_size,
-                    "category": p.category,
-                    "url": p.url,
-                    "image_url": p.image_url,
-                    "dietary_tags": p.dietary_tags.split(",") if p.dietary_tags else [],
-                }
-                for p in products
-            ],
+
+        total_count = count_row.total or 0
+
+        # Get paginated products as raw rows, skipping ORM hydration
+        products_query = text(f"""
+            SELECT {PRODUCT_SELECT}
+            FROM products
+            WHERE session_id = :session_id
+            LIMIT :limit OFFSET :offset
+        """)
+        params = {"session_id": session_id, "limit": limit, "offset": offset}
+        payload = {
             "pagination": {
                 "total": total_count,
                 "offset": offset,
@@ -255,62 +395,166 @@ async def get_session_products_paginated(
                 "has_more": offset + limit < total_count
             }
         }
+
+        # Large pages are read and encoded chunk by chunk as the body streams
+        if min(limit, total_count - offset) > STREAM_THRESHOLD:
+            return stream_products_response(payload, products_query, params)
+
+        products_rows = db.execute(products_query, params).fetchall()
+        return products_response(payload, products_rows)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving products: {str(e)}")
 
 
+@router.get("/session/{session_id}/analytics")
+def get_session_analytics(session_id: str, db: Session = Depends(get_db)):
+    """Precomputed category counts, price range and discount counts for a session"""
+    found = db.query(ScrapeSession.id).filter(ScrapeSession.id == session_id, NOT_DELETING)
+    if not found.first():
+        raise HTTPException(status_code=404, detail="Session not found")
+    analytics = session_analytics(db, session_id)
+    if analytics is None:
+        analytics = {
+            "session_id": session_id,
+            "product_count": 0,
+            "priced_count": 0,
+            "price_min": None,
+            "price_max": None,
+            "price_median": None,
+            "discount_count": 0,
+            "categories": [],
+        }
+    return json_response(analytics)
+
+
+@router.get("/session/{session_id}/diff/{base_session_id}")
+def get_session_diff(
+    session_id: str,
+    base_session_id: str,
+    limit: int = DIFF_LIMIT,
+    db: Session = Depends(get_db),
+):
+    """Products added, removed and re-priced in a session since an earlier one"""
+    found = {
+        row.id
+        for row in db.query(ScrapeSession.id).filter(
+            ScrapeSession.id.in_([session_id, base_session_id]), NOT_DELETING
+        )
+    }
+    if {session_id, base_session_id} - found:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return json_response(session_diff(db, base_session_id, session_id, limit))
+
+
+@router.post("/session/{session_id}/cancel")
+def cancel_session(session_id: str, db: Session = Depends(get_db)):
+    session = (
+        db.query(ScrapeSession).filter(ScrapeSession.id == session_id, NOT_DELETING).first()
+    )
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    if session.status not in (SessionStatus.QUEUED, SessionStatus.IN_PROGRESS):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Session is already {session.status.value}",
+        )
+
+    # Signal the running scrape; its workers stop and close their connections
+    cancel_scrape(session_id)
+
+    # Conditional, like the scrape's own final write: whichever lands first wins
+    updated = (
+        db.query(ScrapeSession)
+        .filter(
+            ScrapeSession.id == session_id,
+            ScrapeSession.status.in_((SessionStatus.QUEUED, SessionStatus.IN_PROGRESS)),
+        )
+        .update(
+            {
+                ScrapeSession.status: SessionStatus.CANCELED,
+                ScrapeSession.stop_reason: STOP_CANCELED,
+                ScrapeSession.completed_at: datetime.now(timezone.utc),
+            },
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    if not updated:
+        db.refresh(session)
+        raise HTTPException(
+            status_code=409,
+            detail=f"Session is already {session.status.value}",
+        )
+
+    return {"message": "Session canceled", "session_id": session_id}
+
+
 @router.delete("/session/{session_id}")
-async def delete_session(session_id: str, db: Session = Depends(get_db)):
+def delete_session(session_id: str, db: Session = Depends(get_db)):
     session = db.query(ScrapeSession).filter(ScrapeSession.id == session_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    # Delete associated products first
-    db.query(Product).filter(Product.session_id == session_id).delete()
-    # Delete the session
-    db.delete(session)
+    # Stop any running scrape first so it doesn't write orphaned products
+    cancel_scrape(session_id, CANCEL_DELETED)
+
+    # Hide the session now; its rows are deleted in small background chunks so
+    # a large session never holds the write lock against running scrapes
+    session.status = SessionStatus.DELETING
     db.commit()
+    janitor.delete(session_id)
 
     return {"message": "Session deleted successfully"}
 
 
-@router.get("/session/{session_id}/export")
-async def export_session_products(session_id: str, db: Session = Depends(get_db)):
-    session = db.query(ScrapeSession).filter(ScrapeSession.id == session_id).first()
+EXPORT_HEADER = [
+    "Name", "Current Price", "Original Price", "Unit Size",
+    "Category", "URL", "Image URL", "Dietary Tags"
+]
+EXPORT_FETCH_ROWS = 2000
+
+
+def build_export(db, session_id):
+    session = (
+        db.query(ScrapeSession).filter(ScrapeSession.id == session_id, NOT_DELETING).first()
+    )
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    products = db.query(Product).filter(Product.session_id == session_id).all()
-    
+    # Stream raw rows in chunks instead of hydrating every Product object
+    result = db.execute(
+        text("""
+            SELECT name, current_price, original_price, unit_size,
+                   category, url, image_url, dietary_tags
+            FROM products
+            WHERE session_id = :session_id
+        """),
+        {"session_id": session_id},
+    )
+
     # Create CSV content
     output = io.StringIO()
     writer = csv.writer(output)
-    
-    # Write header
-    writer.writerow([
-        "Name", "Current Price", "Original Price", "Unit Size", 
-        "Category", "URL", "Image URL", "Dietary Tags"
-    ])
-    
-    # Write product data
-    for product in products:
-        writer.writerow([
-            product.name,
-            product.current_price,
-            product.original_price,
-            product.unit_size,
-            product.category,
-            product.url,
-            product.image_url,
-            product.dietary_tags
-        ])
-    
+    writer.writerow(EXPORT_HEADER)
+    while rows := result.fetchmany(EXPORT_FETCH_ROWS):
+        writer.writerows(rows)
+
     content = output.getvalue()
     output.close()
-    
+    return session.name, content
+
+
+@router.get("/session/{session_id}/export")
+async def export_session_products(session_id: str):
+    # Exports run on their own small pool so they can't stall other requests
+    name, content = await run_db(build_export, session_id, executor=export_executor)
+
     return Response(
         content=content,
         media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={session.name}_products.csv"}
+        headers={"Content-Disposition": f"attachment; filename={name}_products.csv"}
     )
@@ -0,0 +1,189 @@
+import math
+import os
+import re
+import threading
+from urllib.parse import urlparse
+
+from bs4 import BeautifulSoup
+
+from templates import product_signals
+
+# Heuristic score at or above which a page goes straight to full extraction
+ROUTE_ACCEPT_SCORE = float(os.getenv("ROUTE_ACCEPT_SCORE", "0.8"))
+# Heuristic score at or below which a page is dropped without any LLM call;
+# pages in between are shown to the cheap classifier first
+ROUTE_REJECT_SCORE = float(os.getenv("ROUTE_REJECT_SCORE", "0.2"))
+# One in this many rejected pages is extracted anyway, to measure missed products
+ROUTE_AUDIT_EVERY = int(os.getenv("ROUTE_AUDIT_EVERY", "50"))
+CLASSIFIER_SNIPPET_CHARS = 1500  # Page text shown to the classifier
+CLASSIFIER_OUTPUT_TOKENS = 20  # A single boolean comes back
+
+TIER_HEURISTIC = "heuristic"
+TIER_CLASSIFIER = "classifier"
+TIER_EXTRACTOR = "extractor"
+
+PRICE_RE = re.compile(r"[$€£¥₹]\s?\d+(?:[.,]\d{1,2})?")
+CART_RE = re.compile(r"add to (?:cart|basket|bag|trolley)|buy now", re.IGNORECASE)
+PRODUCT_PATH_RE = re.compile(
+    r"/(?:products?|p|item|dp|sku)/|[-/]\d{5,}(?:\.html?)?$", re.IGNORECASE
+)
+LISTING_PATH_RE = re.compile(
+    r"/(?:categor(?:y|ies)|collections?|c|search|browse|aisles?|departments?|brands?|deals|offers)(?:/|$)",
+    re.IGNORECASE,
+)
+
+# Weights of a small logistic model over page features; positive means product-like
+FEATURE_WEIGHTS = {
+    "bias": -1.0,
+    "jsonld": 3.0,  # JSON-LD Product block
+    "og": 2.5,  # og:type product
+    "microdata_price": 1.5,  # itemprop="price"
+    "product_path": 1.5,
+    "listing_path": -2.0,
+    "one_cart_button": 1.5,
+    "many_cart_buttons": -2.5,  # A button per tile: a listing
+    "few_prices": 1.0,
+    "many_prices": -2.5,
+}
+FEW_PRICES = 3  # Distinct prices a product page shows at most (price, was-price, unit price)
+MANY_PRICES = 6
+MANY_CART_BUTTONS = 3
+
+
+def page_features(soup, url):
+    """Names of the FEATURE_WEIGHTS features a parsed page has"""
+    features = set(product_signals(soup))
+    if soup.find(attrs={"itemprop": "price"}):
+        features.add("microdata_price")
+
+    path = urlparse(url).path
+    if PRODUCT_PATH_RE.search(path):
+        features.add("product_path")
+    elif LISTING_PATH_RE.search(path):
+        features.add("listing_path")
+
+    buttons = sum(
+        1
+        for element in soup.find_all(["button", "a", "input"])
+        if CART_RE.search(element.get_text(" ", strip=True) or element.get("value") or "")
+    )
+    if buttons > MANY_CART_BUTTONS:
+        features.add("many_cart_buttons")
+    elif buttons:
+        features.add("one_cart_button")
+
+    body = soup.body or soup
+    prices = set(PRICE_RE.findall(body.get_text(" ", strip=True)))
+    if len(prices) >= MANY_PRICES:
+        features.add("many_prices")
+    elif prices and len(prices) <= FEW_PRICES:
+        features.add("few_prices")
+    return features
+
+
+def product_score(features):
+    """Probability-like score (0-1) that a page with these features is a product page"""
+    z = FEATURE_WEIGHTS["bias"] + sum(FEATURE_WEIGHTS[feature] for feature in features)
+    return 1 / (1 + math.exp(-z))
+
+
+def score_page(html, url):
+    """Heuristic product score and clean text of a page, from a single parse"""
+    soup = BeautifulSoup(html, "html.parser")
+    score = product_score(page_features(soup, url))
+    return score, soup.get_text(separator="\n", strip=True)
+
+
+class TierStats:
+    """Decision counts, latency and checked accuracy for one routing tier"""
+
+    def __init__(self):
+        self.accepted = 0
+        self.rejected = 0
+        self.deferred = 0  # Passed on to the next tier undecided
+        self.calls = 0
+        self.seconds = 0.0
+        self.checked = 0  # Decisions compared against the extraction result
+        self.correct = 0
+
+    def as_dict(self):
+        return {
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "deferred": self.deferred,
+            "calls": self.calls,
+            "avg_latency_ms": round(self.seconds / self.calls * 1000, 1) if self.calls else None,
+            "checked": self.checked,
+            "accuracy": round(self.correct / self.checked, 3) if self.checked else None,
+        }
+
+
+class PageRouter:
+    """Routes pages through cheap is-product tiers before full extraction.
+
+    The local heuristic accepts or rejects pages outside its uncertain
+    band; pages inside it go to the cheap LLM classifier. Each accept is
+    checked against what full extraction found; rejects are checked on
+    the audited sample that is extracted anyway.
+    """
+
+    def __init__(
+        self,
+        accept_score=ROUTE_ACCEPT_SCORE,
+        reject_score=ROUTE_REJECT_SCORE,
+        audit_every=ROUTE_AUDIT_EVERY,
+    ):
+        self.accept_score = accept_score
+        self.reject_score = reject_score
+        self.audit_every = audit_every
+        self.tiers = {
+            tier: TierStats() for tier in (TIER_HEURISTIC, TIER_CLASSIFIER, TIER_EXTRACTOR)
+        }
+        self._rejections = 0
+        self._lock = threading.Lock()
+
+    def route(self, score):
+        """True to accept, False to reject, None to ask the classifier"""
+        if score >= self.accept_score:
+            return True
+        if score <= self.reject_score:
+            return False
+        return None
+
+    def should_audit(self):
+        """Whether this rejected page should be extracted anyway, to check the reject"""
+        with self._lock:
+            self._rejections += 1
+            return self.audit_every > 0 and self._rejections % self.audit_every == 0
+
+    def record(self, tier, seconds, decision=None):
+        with self._lock:
+            stats = self.tiers[tier]
+            stats.calls += 1
+            stats.seconds += seconds
+            if decision is True:
+                stats.accepted += 1
+            elif decision is False:
+                stats.rejected += 1
+            elif tier != TIER_EXTRACTOR:
+                stats.deferred += 1
+
+    def record_outcome(self, decisions, is_product):
+        """Check (tier, accepted) decisions against the extraction result"""
+        with self._lock:
+            for tier, accepted in decisions:
+                stats = self.tiers[tier]
+                stats.checked += 1
+                if accepted == is_product:
+                    stats.correct += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "accept_score": self.accept_score,
+                "reject_score": self.reject_score,
+                "tiers": {tier: stats.as_dict() for tier, stats in self.tiers.items()},
+            }
+
+
+page_router = PageRouter()
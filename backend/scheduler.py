@@ -0,0 +1,165 @@
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+# Global concurrency shared by every active scrape
+FETCH_CONCURRENCY = 60  # Proxy requests in flight across all stores
+LLM_CONCURRENCY = 20  # Model calls in flight across all stores
+
+
+class _AsyncWaiter:
+    def __init__(self):
+        self.granted = False
+        self._loop = asyncio.get_running_loop()
+        self._future = self._loop.create_future()
+
+    def wake(self):
+        def resolve():
+            if not self._future.done():
+                self._future.set_result(None)
+
+        try:
+            self._loop.call_soon_threadsafe(resolve)
+        except RuntimeError:
+            return False  # Loop closed while waiting; nobody will use the slot
+        return True
+
+    async def wait(self):
+        await self._future
+
+
+class FairScheduler:
+    """A counting semaphore that hands out freed slots fairly across stores.
+
+    Waiters queue per store, and each freed slot goes to the next store
+    chosen by smooth weighted round-robin, so a store with thousands of
+    queued pages gets no more than its share while others are waiting.
+    Slots are acquired from coroutines on any event loop (`slot_async`);
+    each page worker thread runs its own loop, so hand-offs cross threads.
+    A store scraped by several sessions at once uses the highest weight any
+    of them set.
+    """
+
+    def __init__(self, name, capacity):
+        self.name = name
+        self.capacity = capacity
+        self.in_use = 0
+        self._lock = threading.Lock()
+        self._waiters = {}  # store -> deque of waiters
+        self._weights = {}  # store -> weights set by the scrapes running it
+        self._current = {}
+
+    def set_weight(self, store, weight):
+        with self._lock:
+            self._weights.setdefault(store, []).append(max(1, int(weight)))
+
+    def clear_weight(self, store, weight):
+        """Withdraw a weight added by set_weight; others for the store remain"""
+        with self._lock:
+            weights = self._weights.get(store)
+            if weights and max(1, int(weight)) in weights:
+                weights.remove(max(1, int(weight)))
+                if not weights:
+                    del self._weights[store]
+
+    def weight(self, store):
+        weights = self._weights.get(store)
+        return max(weights) if weights else 1
+
+    def _try_acquire(self, store, waiter):
+        """Take a free slot or queue waiter; returns True if a slot was taken"""
+        with self._lock:
+            if self.in_use < self.capacity and not self._waiters:
+                self.in_use += 1
+                return True
+            self._waiters.setdefault(store, deque()).append(waiter)
+            return False
+
+    def _next_store(self):
+        # Smooth weighted round-robin over stores that have waiters
+        total = 0
+        best = None
+        for store in self._waiters:
+            weight = self.weight(store)
+            total += weight
+            self._current[store] = self._current.get(store, 0) + weight
+            if best is None or self._current[store] > self._current[best]:
+                best = store
+        self._current[best] -= total
+        return best
+
+    def release(self):
+        with self._lock:
+            waiter = None
+            if self._waiters:
+                store = self._next_store()
+                queue = self._waiters[store]
+                waiter = queue.popleft()
+                if not queue:
+                    del self._waiters[store]
+                    self._current.pop(store, None)
+                # The slot passes straight to the waiter; in_use is unchanged
+                waiter.granted = True
+            else:
+                self.in_use -= 1
+        if waiter and not waiter.wake():
+            self.release()
+
+    def _abandon(self, store, waiter):
+        """Withdraw a waiter that gave up; hand its slot on if it was granted"""
+        with self._lock:
+            queue = self._waiters.get(store)
+            if not waiter.granted and queue and waiter in queue:
+                queue.remove(waiter)
+                if not queue:
+                    del self._waiters[store]
+                    self._current.pop(store, None)
+                return
+        self.release()
+
+    async def acquire_async(self, store):
+        waiter = _AsyncWaiter()
+        if self._try_acquire(store, waiter):
+            return
+        try:
+            await waiter.wait()
+        except asyncio.CancelledError:
+            self._abandon(store, waiter)
+            raise
+
+    @asynccontextmanager
+    async def slot_async(self, store):
+        await self.acquire_async(store)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "capacity": self.capacity,
+                "in_use": self.in_use,
+                "waiting": {store: len(queue) for store, queue in self._waiters.items()},
+            }
+
+
+fetch_scheduler = FairScheduler("fetch", FETCH_CONCURRENCY)
+llm_scheduler = FairScheduler("llm", LLM_CONCURRENCY)
+
+
+def store_key(url):
+    """Scheduling key for the store a URL belongs to"""
+    return urlparse(url).netloc.lower()
+
+
+def set_store_weight(store, weight):
+    fetch_scheduler.set_weight(store, weight)
+    llm_scheduler.set_weight(store, weight)
+
+
+def clear_store_weight(store, weight):
+    fetch_scheduler.clear_weight(store, weight)
+    llm_scheduler.clear_weight(store, weight)
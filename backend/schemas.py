@@ -3,8 +3,76 @@ from typing import Optional
 from pydantic import BaseModel, Field, HttpUrl
 
 
-class ScrapeRequest(BaseModel):
+class ScrapeLimits(BaseModel):
+    max_products: Optional[int] = Field(
+        100, ge=1, description="Stop once this many products have been saved"
+    )
+    max_pages: Optional[int] = Field(
+        None, ge=1, description="Maximum number of pages to fetch"
+    )
+    max_llm_tokens: Optional[int] = Field(
+        None, ge=1, description="Maximum LLM tokens to spend on extraction"
+    )
+    max_seconds: Optional[float] = Field(
+        None, gt=0, description="Maximum wall-clock time for the scrape, in seconds"
+    )
+    max_spend: Optional[float] = Field(
+        None, gt=0, description="Maximum estimated spend (LLM and proxy) in USD"
+    )
+    archive_pages: Optional[bool] = Field(
+        None,
+        description="Archive fetched pages for later re-extraction (defaults to the ARCHIVE_PAGES setting)",
+    )
+
+
+class UrlRules(BaseModel):
+    """Per-store URL canonicalization applied before pages are queued"""
+
+    strip_params: list[str] = Field(
+        default_factory=list,
+        description="Extra query parameters to drop, e.g. variant or sort parameters",
+    )
+    keep_params: Optional[list[str]] = Field(
+        None,
+        description="If set, drop every query parameter not in this list",
+    )
+    lowercase_path: bool = Field(
+        False, description="Treat URL paths as case-insensitive"
+    )
+    strip_trailing_slash: bool = Field(
+        True, description="Treat /product/x/ and /product/x as the same page"
+    )
+    strip_locale_prefix: bool = Field(
+        False, description="Drop a leading locale segment such as /en-gb/"
+    )
+
+
+STICKY_PROXY_DESCRIPTION = (
+    "Keep the store on one proxy while it stays healthy, for stores that tie sessions to an IP; "
+    "defaults to the store's saved setting"
+)
+
+
+class ScrapeRequest(ScrapeLimits):
+    url: HttpUrl
+    url_rules: Optional[UrlRules] = None
+    sticky_proxy: Optional[bool] = Field(None, description=STICKY_PROXY_DESCRIPTION)
+
+
+class BatchStore(BaseModel):
     url: HttpUrl
+    url_rules: Optional[UrlRules] = None
+    sticky_proxy: Optional[bool] = Field(None, description=STICKY_PROXY_DESCRIPTION)
+    weight: int = Field(
+        1,
+        ge=1,
+        le=100,
+        description="Scheduling weight; higher gets a larger share of fetch and LLM capacity",
+    )
+
+
+class BatchScrapeRequest(ScrapeLimits):
+    stores: list[BatchStore] = Field(min_length=1, max_length=200)
 
 
 class ProductSchema(BaseModel):
@@ -37,6 +105,10 @@ class ProductSchema(BaseModel):
     )
 
 
+class PageClass(BaseModel):
+    is_product: bool = Field(description="Is this the detail page of a single product?")
+
+
 class PageAnalysis(BaseModel):
     is_product: bool = Field(description="Is this a product page?")
     product: Optional[ProductSchema] = Field(
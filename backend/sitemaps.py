@@ -0,0 +1,360 @@
+import asyncio
+import gzip
+import queue
+import re
+import time
+import xml.etree.ElementTree as ET
+from contextlib import aclosing, asynccontextmanager
+from urllib.parse import urljoin, urlparse
+
+import aiohttp
+
+from canonical import canonicalize_url
+from cpu import run_cpu
+from proxies import ROUTE_ERROR_STATUSES, proxy_pool
+from scheduler import fetch_scheduler, store_key
+
+RELEVANT_PATHS = ["/shop/", "/product/", "/groceries/"]
+SITEMAP_CANDIDATES = [
+    "/sitemap.xml",
+    "/sitemap_index.xml",
+    "/sitemap-index.xml",
+    "/sitemaps.xml",
+    "/groceries/sitemap.xml",
+    "/shop/sitemaps/sitemap-index.xml",
+]
+SITEMAP_CONCURRENCY = 20
+SITEMAP_TIMEOUT = 60
+
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+
+class UrlFeed:
+    """Thread-safe hand-off of discovered product URLs to the page workers.
+
+    Discovery runs on its own event loop and pushes URLs as soon as each
+    sitemap is parsed; the page workers poll the feed while it is open.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.error = None
+        self.closed = False
+        self.sitemaps = []  # The sitemaps discovery read, for the store registry
+        self._queue = queue.Queue()
+
+    def put(self, url):
+        self.count += 1
+        self._queue.put(url)
+
+    def close(self, error=None):
+        self.error = error
+        self._queue.put(None)
+
+    def get(self, timeout=None):
+        """Next URL, or None once discovery has finished.
+
+        Raises queue.Empty if nothing arrives within timeout.
+        """
+        if self.closed:
+            return None
+        url = self._queue.get(timeout=timeout)
+        if url is None:
+            self.closed = True
+        return url
+
+
+def create_http_session(limit=SITEMAP_CONCURRENCY):
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(ssl=False, limit=limit),
+        timeout=aiohttp.ClientTimeout(total=SITEMAP_TIMEOUT),
+    )
+
+
+def sitemap_key(url):
+    """Identity of a sitemap regardless of a .gz suffix"""
+    url = url.strip()
+    return url[:-3] if url.endswith(".gz") else url
+
+
+@asynccontextmanager
+async def proxied_get(http, url, proxies=None):
+    """http.get through a route from the proxy pool, reporting how it went"""
+    with (proxies or proxy_pool).route(store_key(url)) as route:
+        started = time.monotonic()
+        try:
+            async with http.get(url, proxy=route.proxy.url) as response:
+                latency = time.monotonic() - started
+                if response.status in ROUTE_ERROR_STATUSES:
+                    route.failed(latency)
+                else:
+                    route.succeeded(latency)
+                yield response
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            route.failed(time.monotonic() - started)  # No-op if already reported
+            raise
+
+
+async def fetch_content(url, http, proxies=None):
+    try:
+        async with fetch_scheduler.slot_async(store_key(url)):
+            async with proxied_get(http, url, proxies) as response:
+                if response.status != 200:
+                    return None
+                content = await response.read()
+    except Exception:
+        return None
+
+    if content.startswith(b"\x1f\x8b"):
+        try:
+            content = gzip.decompress(content)
+        except Exception:
+            return None
+    return content
+
+
+async def fetch_sitemap(url, http, proxies=None):
+    """Fetch a sitemap, falling back to its .gz (or plain) twin if needed"""
+    content = await fetch_content(url, http, proxies)
+    if content is None:
+        key = sitemap_key(url)
+        alternate = key + ".gz" if key == url.strip() else key
+        content = await fetch_content(alternate, http, proxies)
+    return content
+
+
+def _looks_like_sitemap(content_type, content):
+    return (
+        "xml" in content_type.lower()
+        or content.startswith(b"<?xml")
+        or content.startswith(b"<sitemapindex")
+    )
+
+
+async def _probe_candidate(url, http, proxies):
+    try:
+        async with fetch_scheduler.slot_async(store_key(url)):
+            async with proxied_get(http, url, proxies) as response:
+                if response.status != 200:
+                    return None
+                content_type = response.headers.get("Content-Type", "")
+                content = await response.read()
+        if _looks_like_sitemap(content_type, content):
+            return url
+    except Exception:
+        pass
+    return None
+
+
+async def find_initial_sitemaps(base_url, http, proxies=None):
+    initial_sitemaps = []
+    robots_url = urljoin(base_url, "/robots.txt")
+    try:
+        async with fetch_scheduler.slot_async(store_key(robots_url)):
+            async with proxied_get(http, robots_url, proxies) as response:
+                response.raise_for_status()
+                robots = await response.text(errors="replace")
+        sitemap_lines = re.findall(
+            r"^Sitemap:\s*(.+)$", robots, re.MULTILINE | re.IGNORECASE
+        )
+        initial_sitemaps = [
+            url.strip() for url in sitemap_lines if url.strip().startswith("http")
+        ]
+    except Exception:
+        pass
+
+    if not initial_sitemaps:
+        # Probe all candidate paths at once rather than one after another
+        probes = await asyncio.gather(
+            *(
+                _probe_candidate(urljoin(base_url, path), http, proxies)
+                for path in SITEMAP_CANDIDATES
+            )
+        )
+        initial_sitemaps = [url for url in probes if url]
+
+    return initial_sitemaps
+
+
+def parse_sitemap_content(content, netloc, patterns=None):
+    """Product URLs (paths containing one of patterns) and sub-sitemaps of a sitemap.
+
+    URLs keep the order the sitemap lists them in, so discovery fetches
+    the first spelling of each page.
+    """
+    patterns = patterns or RELEVANT_PATHS
+    urls = {}  # Ordered set
+    sub_sitemaps = []
+    try:
+        root = ET.fromstring(content)
+        ns = {"s": SITEMAP_NS}
+        if root.tag == f"{{{SITEMAP_NS}}}sitemapindex":
+            sub_sitemaps = [
+                elem.text.strip() for elem in root.findall(".//s:loc", ns) if elem.text
+            ]
+        else:
+            for loc in root.findall(".//s:loc", ns):
+                if loc.text:
+                    loc_url = loc.text.strip()
+                    parsed_loc = urlparse(loc_url)
+                    if parsed_loc.netloc.lower() == netloc and any(
+                        path in parsed_loc.path for path in patterns
+                    ):
+                        urls[loc_url] = None
+    except Exception:
+        pass
+    return list(urls), sub_sitemaps
+
+
+async def iter_sitemap_urls(
+    initial_sitemaps, netloc, http, budget=None, proxies=None, patterns=None
+):
+    """Yield batches of product URLs as soon as each sitemap is parsed.
+
+    Sitemaps form a single work queue served by SITEMAP_CONCURRENCY workers:
+    sub-sitemaps are scheduled the moment their index is parsed instead of
+    waiting for the whole level, and each sitemap is fetched at most once
+    across its .gz and plain variants.
+    """
+    frontier = asyncio.Queue()
+    results = asyncio.Queue()
+    scheduled = set()
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    token = budget.token if budget else None
+
+    def schedule(url):
+        key = sitemap_key(url)
+        if key not in scheduled:
+            scheduled.add(key)
+            frontier.put_nowait(url)
+
+    def request_stop():
+        try:
+            loop.call_soon_threadsafe(stop.set)
+        except RuntimeError:
+            pass  # Loop already closed
+
+    async def worker():
+        while True:
+            url = await frontier.get()
+            try:
+                if budget and budget.stopped:
+                    continue
+                content = await fetch_sitemap(url, http, proxies)
+                if content:
+                    # XML parsing is CPU-bound; the process pool keeps it off the GIL
+                    urls, sub_sitemaps = await run_cpu(
+                        parse_sitemap_content, content, netloc, patterns, store=netloc
+                    )
+                    for sub in sub_sitemaps:
+                        schedule(sub)
+                    if urls:
+                        results.put_nowait(urls)
+            finally:
+                frontier.task_done()
+
+    for url in initial_sitemaps:
+        schedule(url)
+
+    if token:
+        token.add_callback(request_stop)
+    workers = [asyncio.create_task(worker()) for _ in range(SITEMAP_CONCURRENCY)]
+    drained = asyncio.create_task(frontier.join())
+    stopped = asyncio.create_task(stop.wait())
+    try:
+        while True:
+            getter = asyncio.create_task(results.get())
+            done, _ = await asyncio.wait(
+                {getter, drained, stopped}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if stopped in done:
+                getter.cancel()  # Even if a batch was ready: the scrape is cancelled
+                break
+            if getter in done:
+                yield getter.result()
+                continue
+
+            getter.cancel()
+            while not results.empty():
+                yield results.get_nowait()
+            break
+    finally:
+        if token:
+            token.remove_callback(request_stop)
+        for task in (*workers, drained, stopped):
+            task.cancel()
+        await asyncio.gather(*workers, drained, stopped, return_exceptions=True)
+
+
+async def discover_product_urls(
+    base_url,
+    netloc,
+    feed,
+    budget=None,
+    url_rules=None,
+    proxies=None,
+    known=None,
+):
+    """Find the store's sitemaps and stream unique product URLs into feed.
+
+    URLs are deduplicated on their canonical form (with the store's
+    url_rules), so spelling variants of one page are fetched once, under
+    the first spelling the sitemap lists.
+    With a KnownStore from the registry its cached sitemaps and URL
+    patterns are used instead of probing; if they no longer yield any
+    URLs, discovery starts over from robots.txt. The sitemaps used are
+    left in feed.sitemaps.
+    """
+    seen = set()
+
+    async def stream(initial_sitemaps, patterns):
+        batches = iter_sitemap_urls(
+            initial_sitemaps, netloc, http, budget, proxies, patterns
+        )
+        async with aclosing(batches):
+            async for urls in batches:
+                for url in urls:
+                    # The canonical form is only the dedupe key; the URL the
+                    # sitemap lists is what gets fetched (it may need its slash)
+                    key = canonicalize_url(url, url_rules)
+                    if key in seen:
+                        continue
+                    if budget and (
+                        budget.stopped
+                        or (budget.max_pages and len(seen) >= budget.max_pages)
+                    ):
+                        return
+                    seen.add(key)
+                    feed.put(url)
+
+    async with create_http_session() as http:
+        if known and known.sitemap_urls:
+            feed.sitemaps = known.sitemap_urls
+            await stream(known.sitemap_urls, known.url_patterns)
+            if seen or (budget and budget.stopped):
+                return
+            print(f"Cached sitemaps for {netloc} yielded nothing; probing again")
+
+        initial_sitemaps = await find_initial_sitemaps(base_url, http, proxies)
+        if not initial_sitemaps:
+            raise ValueError("No sitemaps found.")
+        feed.sitemaps = initial_sitemaps
+        await stream(initial_sitemaps, None)
+
+
+def run_discovery(
+    base_url, netloc, feed, budget=None, url_rules=None, proxies=None, known=None
+):
+    """Thread entry point: run discovery on its own event loop, then close feed"""
+    error = None
+    try:
+        asyncio.run(
+            discover_product_urls(
+                base_url, netloc, feed, budget, url_rules, proxies, known
+            )
+        )
+    except Exception as e:
+        error = e
+    finally:
+        feed.close(error)
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+import zstandard
+
+from database import delete_in_chunks
+from models import PageSnapshot
+
+# Content-addressed archive of fetched pages, for re-extraction without re-fetching
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+SNAPSHOT_ZSTD_LEVEL = 10
+# Objects written or reused this recently are never garbage collected, so a
+# scrape archiving the same page while a session is deleted keeps its copy
+SNAPSHOT_GC_GRACE_SECONDS = 3600
+SNAPSHOT_GC_BATCH = 500
+# Archive pages by default for every scrape (requests can also opt in per scrape)
+ARCHIVE_PAGES_DEFAULT = os.getenv("ARCHIVE_PAGES", "").lower() in ("1", "true", "yes")
+
+
+class SnapshotStore:
+    """zstd-compressed page bodies on local disk, deduplicated by SHA-256.
+
+    Objects live at <root>/objects/<aa>/<bb>/<hash>.zst and are written
+    atomically, so identical pages fetched by different sessions (or twice
+    in one session) are stored once.
+    """
+
+    def __init__(self, root=SNAPSHOT_DIR, level=SNAPSHOT_ZSTD_LEVEL):
+        self.root = root
+        self.level = level
+        self._local = threading.local()
+
+    def _codecs(self):
+        # zstd contexts are not thread-safe; keep one pair per thread
+        if not hasattr(self._local, "compressor"):
+            self._local.compressor = zstandard.ZstdCompressor(level=self.level)
+            self._local.decompressor = zstandard.ZstdDecompressor()
+        return self._local.compressor, self._local.decompressor
+
+    def path_for(self, content_hash):
+        return os.path.join(
+            self.root, "objects", content_hash[:2], content_hash[2:4], f"{content_hash}.zst"
+        )
+
+    def put(self, content):
+        """Store content; returns its hash (a no-op if already archived)"""
+        content_hash = hashlib.sha256(content).hexdigest()
+        path = self.path_for(content_hash)
+        if os.path.exists(path):
+            os.utime(path)  # Mark as in use for the garbage collector
+            return content_hash
+
+        compressor, _ = self._codecs()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(compressor.compress(content))
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return content_hash
+
+    def get(self, content_hash):
+        _, decompressor = self._codecs()
+        with open(self.path_for(content_hash), "rb") as f:
+            return decompressor.decompress(f.read())
+
+    def discard(self, content_hashes, grace=SNAPSHOT_GC_GRACE_SECONDS):
+        """Remove objects, skipping any written or reused within grace seconds"""
+        removed = 0
+        cutoff = time.time() - grace
+        for content_hash in content_hashes:
+            path = self.path_for(content_hash)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+
+snapshot_store = SnapshotStore()
+
+
+def delete_session_snapshots(db, session_id):
+    """Delete a session's snapshot rows and the objects no other session uses.
+
+    Objects are shared between sessions, so only hashes left without any
+    referencing row after the delete are removed from disk. Rows are
+    deleted a committed chunk at a time.
+    """
+    hashes = {
+        content_hash
+        for (content_hash,) in db.query(PageSnapshot.content_hash)
+        .filter(PageSnapshot.session_id == session_id)
+        .distinct()
+    }
+    delete_in_chunks(db, PageSnapshot.__tablename__, session_id)
+
+    orphaned = set()
+    hashes = list(hashes)
+    for start in range(0, len(hashes), SNAPSHOT_GC_BATCH):
+        batch = hashes[start : start + SNAPSHOT_GC_BATCH]
+        still_used = {
+            content_hash
+            for (content_hash,) in db.query(PageSnapshot.content_hash)
+            .filter(PageSnapshot.content_hash.in_(batch))
+            .distinct()
+        }
+        orphaned.update(set(batch) - still_used)
+    return snapshot_store.discard(orphaned)
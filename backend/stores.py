@@ -0,0 +1,120 @@
+import json
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+
+from sqlalchemy import or_
+
+from models import Store
+from schemas import UrlRules
+from sitemaps import RELEVANT_PATHS
+
+# How long a store's validation and sitemaps are trusted before being re-checked
+STORE_REFRESH_HOURS = float(os.getenv("STORE_REFRESH_HOURS", "168"))
+# Share of a scrape's products a path prefix needs to be kept as a learned URL pattern
+URL_PATTERN_MIN_SHARE = 0.05
+
+
+def _fresh(timestamp, now):
+    if timestamp is None:
+        return False
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)  # SQLite drops the offset
+    return now - timestamp < timedelta(hours=STORE_REFRESH_HOURS)
+
+
+def _load(value):
+    return json.loads(value) if value else []
+
+
+class KnownStore:
+    """Plain copy of a registry row, safe to use after its session has closed"""
+
+    def __init__(self, row, now=None):
+        now = now or datetime.now(timezone.utc)
+        self.netloc = row.netloc
+        self.base_url = row.base_url
+        self.name = row.name
+        self.url_rules = UrlRules.model_validate_json(row.url_rules) if row.url_rules else None
+        self.sticky_proxy = bool(row.sticky_proxy)
+        self.validated = _fresh(row.validated_at, now)
+        discovered = _fresh(row.discovered_at, now)
+        # Stale discovery is re-run from scratch rather than trusted
+        self.sitemap_urls = _load(row.sitemap_urls) if discovered else []
+        self.url_patterns = _load(row.url_patterns) if discovered else []
+
+
+def find_store(db, host):
+    """The registry entry for a host (its netloc or a host that redirected to it), or None"""
+    host = host.lower()
+    row = (
+        db.query(Store)
+        .filter(or_(Store.netloc == host, Store.aliases.contains(json.dumps(host))))
+        .first()
+    )
+    return KnownStore(row) if row else None
+
+
+def remember_store(
+    db, host, base_url, name, url_rules=None, sticky_proxy=None, validated=True
+):
+    """Record a store resolved from host, and the crawl settings used for it.
+
+    Adds to db without committing, so the caller can commit it along with
+    the session it creates. validated=False keeps the old validation time,
+    for scrapes that were served from the registry.
+    """
+    netloc = urlparse(base_url).netloc.lower()
+    row = db.get(Store, netloc)
+    if row is None:
+        row = Store(netloc=netloc, base_url=base_url)
+        db.add(row)
+    row.base_url = base_url
+    row.name = name
+    if validated or row.validated_at is None:
+        row.validated_at = datetime.now(timezone.utc)
+    host = host.lower()
+    aliases = _load(row.aliases)
+    if host != netloc and host not in aliases:
+        row.aliases = json.dumps(aliases + [host])
+    if url_rules is not None:
+        row.url_rules = url_rules.model_dump_json()
+    if sticky_proxy is not None:
+        row.sticky_proxy = sticky_proxy
+    return row
+
+
+def learn_url_patterns(urls):
+    """Path prefixes that a meaningful share of product URLs live under.
+
+    A prefix runs up to and including the RELEVANT_PATHS segment the URL
+    was discovered by, so locale-prefixed stores learn "/en/product/"
+    rather than "/en/" (which would take in every page of the site).
+    """
+    prefixes = Counter()
+    for url in urls:
+        path = urlparse(url).path.lower()
+        matches = [
+            path.find(relevant) + len(relevant)
+            for relevant in RELEVANT_PATHS
+            if relevant in path
+        ]
+        if matches:
+            prefixes[path[: min(matches)]] += 1
+    total = sum(prefixes.values())
+    return sorted(
+        prefix for prefix, count in prefixes.items() if count >= total * URL_PATTERN_MIN_SHARE
+    )
+
+
+def remember_discovery(db, netloc, sitemap_urls, product_urls):
+    """Record the sitemaps that worked for a store and the URL patterns of its products"""
+    row = db.get(Store, netloc.lower())
+    if row is None or not sitemap_urls:
+        return
+    row.sitemap_urls = json.dumps(sorted(sitemap_urls))
+    patterns = learn_url_patterns(product_urls)
+    row.url_patterns = json.dumps(patterns) if patterns else None
+    row.discovered_at = datetime.now(timezone.utc)
+    db.commit()
@@ -0,0 +1,520 @@
+import json
+import math
+import re
+import threading
+from collections import deque
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+from schemas import ProductSchema
+
+# LLM-extracted product pages collected per store before selectors are learned
+TEMPLATE_SAMPLE_PAGES = 5
+# Share of samples a selector must reproduce to be accepted for a field
+TEMPLATE_MIN_AGREEMENT = 0.8
+# One in this many template extractions is re-checked against the LLM
+SPOT_CHECK_EVERY = 25
+# Relearn once this many of the last SPOT_CHECK_WINDOW checks disagree
+SPOT_CHECK_WINDOW = 5
+SPOT_CHECK_MAX_FAILURES = 2
+# Pages the LLM said were not products, kept to tell product structure apart
+TEMPLATE_NEGATIVE_PAGES = 5
+# Share of the learned product-page structure a page must have to fit
+TEMPLATE_MIN_STRUCTURE_MATCH = 0.9
+
+TEXT_FIELDS = ["name", "current_price", "original_price", "unit_size", "category"]
+PRICE_FIELDS = {"current_price", "original_price"}
+# Fields that must resolve for a page to count as matching the template
+REQUIRED_FIELDS = {"name", "current_price"}
+# Largest element text considered a match for a short field value
+MAX_TEXT_OVERHANG = 24
+MAX_SELECTOR_DEPTH = 4
+MAX_TAG_CONTAINER_TEXT = 600
+
+DIETARY_VOCABULARY = [
+    "vegan",
+    "vegetarian",
+    "gluten-free",
+    "dairy-free",
+    "nut-free",
+    "organic",
+    "kosher",
+    "halal",
+    "non-gmo",
+    "sugar-free",
+    "keto",
+]
+
+PRICE_RE = re.compile(r"[$€£¥₹]?\s?\d[\d,]*(?:[.,]\d{1,2})?\s?[$€£¥₹]?")
+_DYNAMIC_TOKEN_RE = re.compile(r"\d{3,}|^[a-z]{1,3}-[a-z0-9]{5,}$|__")
+
+
+def _normalize(value):
+    return re.sub(r"\s+", " ", str(value)).strip().casefold()
+
+
+def _price_digits(value):
+    return re.sub(r"[^\d]", "", str(value))
+
+
+def _values_match(field, expected, actual):
+    if expected is None or actual is None:
+        return expected is None and actual is None
+    if field in PRICE_FIELDS:
+        return _price_digits(expected) == _price_digits(actual) != ""
+    return _normalize(expected) == _normalize(actual)
+
+
+def _element_text(element):
+    return element.get_text(" ", strip=True)
+
+
+def _clean_price(text):
+    match = PRICE_RE.search(text)
+    return match.group(0).strip() if match else None
+
+
+def _stable_tokens(tokens):
+    return [token for token in tokens if not _DYNAMIC_TOKEN_RE.search(token)]
+
+
+def _simple_selector(element):
+    """CSS for one element: tag plus id or stable classes"""
+    selector = element.name
+    element_id = element.get("id")
+    if element_id and not _DYNAMIC_TOKEN_RE.search(element_id):
+        return f"{selector}#{element_id}"
+    for css_class in _stable_tokens(element.get("class", []))[:3]:
+        selector += f".{css_class}"
+    for attr in ("itemprop", "property", "data-testid"):
+        if element.get(attr) and '"' not in element[attr]:
+            selector += f'[{attr}="{element[attr]}"]'
+            break
+    return selector
+
+
+def selector_for(element, soup):
+    """Shortest ancestor-anchored CSS selector whose first match is element"""
+    parts = []
+    node = element
+    for _ in range(MAX_SELECTOR_DEPTH):
+        if node is None or node.name in (None, "[document]"):
+            break
+        parts.insert(0, _simple_selector(node))
+        selector = " > ".join(parts)
+        try:
+            matches = soup.select(selector, limit=2)
+        except Exception:
+            return None
+        if matches and matches[0] is element:
+            if len(matches) == 1 or node.get("id"):
+                return selector
+        node = node.parent
+    selector = " > ".join(parts)
+    try:
+        return selector if soup.select_one(selector) is element else None
+    except Exception:
+        return None
+
+
+class FieldRule:
+    """How to pull one ProductSchema field out of a page"""
+
+    def __init__(self, field, selector, attr=None):
+        self.field = field
+        self.selector = selector
+        self.attr = attr
+
+    def _element(self, soup):
+        try:
+            return soup.select_one(self.selector)
+        except Exception:
+            return None
+
+    def count(self, soup):
+        try:
+            return len(soup.select(self.selector))
+        except Exception:
+            return 0
+
+    def text_length(self, soup):
+        element = self._element(soup)
+        return len(_element_text(element)) if element is not None else 0
+
+    def apply(self, soup, url):
+        element = self._element(soup)
+        if element is None:
+            return None
+        if self.attr:
+            value = element.get(self.attr)
+            if value and self.field == "image_url":
+                value = urljoin(url, value)
+            return value or None
+        text = _element_text(element)
+        if self.field in PRICE_FIELDS:
+            return _clean_price(text)
+        return text or None
+
+    def __repr__(self):
+        return f"FieldRule({self.field!r}, {self.selector!r}, attr={self.attr!r})"
+
+
+def page_signatures(soup):
+    """Structural fingerprint of a page: the simple selectors of its elements"""
+    body = soup.body or soup
+    return {
+        _simple_selector(element)
+        for element in body.find_all(True)
+        if element.name not in ("script", "style", "noscript")
+    }
+
+
+def _is_product_type(value):
+    types = value if isinstance(value, list) else [value]
+    return any(str(t).rsplit("/", 1)[-1].lower() == "product" for t in types)
+
+
+def _has_jsonld_product(data):
+    if isinstance(data, list):
+        return any(_has_jsonld_product(item) for item in data)
+    if isinstance(data, dict):
+        if _is_product_type(data.get("@type")):
+            return True
+        return any(_has_jsonld_product(data[key]) for key in ("@graph", "mainEntity") if key in data)
+    return False
+
+
+def product_signals(soup):
+    """Explicit markers a page declares itself a product: JSON-LD and Open Graph"""
+    signals = set()
+    for script in soup.find_all("script", type="application/ld+json"):
+        try:
+            if _has_jsonld_product(json.loads(script.string or "")):
+                signals.add("jsonld")
+                break
+        except ValueError:
+            continue
+    og_type = soup.find("meta", attrs={"property": "og:type"})
+    if og_type and "product" in (og_type.get("content") or "").lower():
+        signals.add("og")
+    return signals
+
+
+def _candidate_rules(field, value, soup, url):
+    """Selectors on one page that reproduce the LLM's value for field"""
+    rules = []
+    if field == "image_url":
+        for element in soup.find_all(["img", "meta", "link", "source"]):
+            for attr in ("src", "data-src", "content", "href"):
+                if element.get(attr) and urljoin(url, element[attr]) == value:
+                    selector = selector_for(element, soup)
+                    if selector:
+                        rules.append(FieldRule(field, selector, attr))
+        return rules
+
+    wanted = _price_digits(value) if field in PRICE_FIELDS else _normalize(value)
+    if not wanted:
+        return rules
+
+    for element in soup.find_all(["meta"]):
+        content = element.get("content")
+        if content and _values_match(field, value, content):
+            selector = selector_for(element, soup)
+            if selector:
+                rules.append(FieldRule(field, selector, "content"))
+
+    # Deepest elements whose text carries the value and little else
+    for element in soup.body.find_all(True) if soup.body else []:
+        if element.name in ("script", "style", "noscript"):
+            continue
+        text = _element_text(element)
+        if not text or len(text) > len(str(value)) + MAX_TEXT_OVERHANG:
+            continue
+        if field in PRICE_FIELDS:
+            found = _clean_price(text)
+            matched = found is not None and _price_digits(found) == wanted
+        else:
+            matched = _normalize(text) == wanted
+        if not matched:
+            continue
+        # Skip wrappers whose single child already matches
+        children = element.find_all(True, recursive=False)
+        if len(children) == 1 and _element_text(children[0]) == text:
+            continue
+        selector = selector_for(element, soup)
+        if selector:
+            rules.append(FieldRule(field, selector))
+    return rules
+
+
+def _tags_rule(tags, soup):
+    """Smallest element whose text contains every dietary tag of the sample"""
+    wanted = [_normalize(tag) for tag in tags]
+    best = None
+    for element in soup.body.find_all(True) if soup.body else []:
+        text = _normalize(_element_text(element))
+        if len(text) > MAX_TAG_CONTAINER_TEXT:
+            continue
+        if all(tag in text for tag in wanted):
+            if best is None or len(text) < len(_normalize(_element_text(best))):
+                best = element
+    if best is None:
+        return None
+    selector = selector_for(best, soup)
+    return FieldRule("dietary_tags", selector) if selector else None
+
+
+class StoreTemplate:
+    """Selectors learned for one store, plus what marks a page as a product.
+
+    Generic selectors (an h1, a price span) also resolve on category and
+    listing pages, so a page only fits when it also carries the product
+    signals every sample had, has no more matches per selector than the
+    samples did, and shares the product-page structure (profile) learned
+    from the samples.
+    """
+
+    def __init__(self, rules, tags_rule, vocabulary, profile, signals, max_matches):
+        self.rules = rules
+        self.tags_rule = tags_rule
+        self.vocabulary = vocabulary
+        self.profile = profile
+        self.signals = signals
+        self.max_matches = max_matches
+
+    def fits(self, soup):
+        """Whether a page looks like the product pages the template was learned on"""
+        if not self.signals <= product_signals(soup):
+            return False
+        for field, rule in self.rules.items():
+            if rule.count(soup) > self.max_matches[field]:
+                return False
+        shared = len(self.profile & page_signatures(soup))
+        return shared >= TEMPLATE_MIN_STRUCTURE_MATCH * len(self.profile)
+
+    def extract(self, html, url):
+        """Apply the template; returns None if the page doesn't fit it"""
+        soup = BeautifulSoup(html, "html.parser")
+        if not self.fits(soup):
+            return None
+        values = {}
+        for field, rule in self.rules.items():
+            values[field] = rule.apply(soup, url)
+        if any(values.get(field) is None for field in REQUIRED_FIELDS if field in self.rules):
+            return None
+        if not values.get("name"):
+            return None
+
+        tags = []
+        if self.tags_rule:
+            container = self.tags_rule.apply(soup, url)
+            if container:
+                text = _normalize(container)
+                tags = [tag for tag in self.vocabulary if _normalize(tag) in text]
+
+        return ProductSchema(url=url, dietary_tags=tags, **values)
+
+
+def _structure_profile(soups, negative_soups):
+    """Signatures on most product samples and on none of the non-product pages"""
+    counts = {}
+    for soup in soups:
+        for signature in page_signatures(soup):
+            counts[signature] = counts.get(signature, 0) + 1
+    needed = math.ceil(len(soups) * TEMPLATE_MIN_AGREEMENT)
+    profile = {signature for signature, count in counts.items() if count >= needed}
+    for soup in negative_soups:
+        profile -= page_signatures(soup)
+    return profile
+
+
+def learn_template(samples, negatives=()):
+    """Induce a StoreTemplate from (html, url, ProductSchema) samples.
+
+    Each sample proposes candidate selectors per field; a selector is kept
+    when it reproduces the LLM's value on at least TEMPLATE_MIN_AGREEMENT of
+    the samples that have that field. negatives are HTML pages from the same
+    store the LLM said were not products. Returns None if no name selector
+    generalizes, or if there is nothing (no negatives and no JSON-LD/Open
+    Graph product markers) to tell product pages from other pages.
+    """
+    parsed = [(BeautifulSoup(html, "html.parser"), url, product) for html, url, product in samples]
+    negative_soups = [BeautifulSoup(html, "html.parser") for html in negatives]
+
+    profile = _structure_profile([soup for soup, _, _ in parsed], negative_soups)
+    if not profile:
+        return None
+
+    rules = {}
+    for field in [*TEXT_FIELDS, "image_url"]:
+        with_value = [
+            (soup, url, getattr(product, field))
+            for soup, url, product in parsed
+            if getattr(product, field)
+        ]
+        if not with_value:
+            continue
+        needed = math.ceil(len(with_value) * TEMPLATE_MIN_AGREEMENT)
+
+        candidates = {}
+        for soup, url, value in with_value:
+            for rule in _candidate_rules(field, value, soup, url):
+                candidates.setdefault((rule.selector, rule.attr), rule)
+
+        # Most samples reproduced wins; ties go to the tightest element
+        best, best_key = None, (0, 0)
+        for rule in candidates.values():
+            score = sum(
+                _values_match(field, value, rule.apply(soup, url))
+                for soup, url, value in with_value
+            )
+            overhang = sum(rule.text_length(soup) for soup, _, _ in with_value)
+            key = (score, -overhang)
+            if score and (best is None or key > best_key):
+                best, best_key = rule, key
+        if best and best_key[0] >= needed:
+            rules[field] = best
+
+    if "name" not in rules:
+        return None
+
+    vocabulary = list(DIETARY_VOCABULARY)
+    tags_rule = None
+    for soup, _, product in parsed:
+        for tag in product.dietary_tags:
+            if _normalize(tag) not in map(_normalize, vocabulary):
+                vocabulary.append(tag)
+        if tags_rule is None and product.dietary_tags:
+            tags_rule = _tags_rule(product.dietary_tags, soup)
+
+    signals = set.intersection(*(product_signals(soup) for soup, _, _ in parsed))
+    if not signals and not negative_soups:
+        return None  # Nothing yet to tell product pages from other pages
+    max_matches = {
+        field: max(rule.count(soup) for soup, _, _ in parsed)
+        for field, rule in rules.items()
+    }
+    template = StoreTemplate(rules, tags_rule, vocabulary, profile, signals, max_matches)
+    # Never learn a template that would already accept a known non-product page
+    if any(template.fits(soup) for soup in negative_soups):
+        return None
+    return template
+
+
+def products_match(expected, actual):
+    """Compare a template extraction against the LLM's on the template fields"""
+    if expected is None or actual is None:
+        return expected is None and actual is None
+    return all(
+        _values_match(field, getattr(expected, field), getattr(actual, field))
+        for field in [*TEXT_FIELDS, "image_url"]
+        if getattr(expected, field) is not None
+    )
+
+
+class TemplateLearner:
+    """Per-store wrapper induction state shared by all page workers.
+
+    Collects the first TEMPLATE_SAMPLE_PAGES LLM extractions, learns a
+    template from them, then serves template extractions. Every
+    SPOT_CHECK_EVERY-th extraction is checked against the LLM, and too many
+    disagreements throw the template away so it is relearned from fresh
+    samples.
+    """
+
+    def __init__(self, netloc):
+        self.netloc = netloc
+        self.template = None
+        self.template_extractions = 0
+        self.relearns = 0
+        self._samples = []
+        self._negatives = deque(maxlen=TEMPLATE_NEGATIVE_PAGES)
+        self._checks = deque(maxlen=SPOT_CHECK_WINDOW)
+        self._learning = False
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.template is not None
+
+    def extract(self, html, url):
+        template = self.template
+        if template is None:
+            return None
+        try:
+            product = template.extract(html, url)
+        except Exception as e:
+            print(f"Template extraction failed for {url}: {e}")
+            return None
+        return self.record_extraction(product)
+
+    def record_extraction(self, product):
+        """Count a template extraction made elsewhere (e.g. in a worker process)"""
+        if product is not None:
+            with self._lock:
+                self.template_extractions += 1
+        return product
+
+    def should_spot_check(self):
+        with self._lock:
+            return self.template_extractions % SPOT_CHECK_EVERY == 1
+
+    def add_sample(self, html, url, product):
+        """Record an LLM product extraction; learns once enough are collected"""
+        with self._lock:
+            if self.template is not None or self._learning:
+                return
+            self._samples.append((html, url, product))
+            if len(self._samples) < TEMPLATE_SAMPLE_PAGES:
+                return
+            samples, self._samples = self._samples, []
+            negatives = list(self._negatives)
+            self._learning = True
+
+        try:
+            template = learn_template(samples, negatives)
+        except Exception as e:
+            print(f"Template learning failed for {self.netloc}: {e}")
+            template = None
+        finally:
+            with self._lock:
+                self._learning = False
+
+        if template:
+            print(f"Learned extraction template for {self.netloc}: {template.rules}")
+            with self._lock:
+                self.template = template
+                self._checks.clear()
+        else:
+            print(f"Could not learn a template for {self.netloc}; will retry with new samples")
+
+    def add_negative(self, html):
+        """Record a page the LLM said is not a product"""
+        with self._lock:
+            self._negatives.append(html)
+
+    def record_check(self, template_product, llm_product):
+        """Record a spot check; drops the template if it has drifted"""
+        matched = products_match(llm_product, template_product)
+        with self._lock:
+            self._checks.append(matched)
+            failures = self._checks.count(False)
+            if failures >= SPOT_CHECK_MAX_FAILURES and self.template is not None:
+                print(f"Template for {self.netloc} drifted ({failures} failed checks); relearning")
+                self.template = None
+                self.relearns += 1
+                self._checks.clear()
+        return matched
+
+
+_learners = {}
+_learners_lock = threading.Lock()
+
+
+def template_learner(netloc):
+    with _learners_lock:
+        learner = _learners.get(netloc)
+        if learner is None:
+            learner = _learners[netloc] = TemplateLearner(netloc)
+        return learner
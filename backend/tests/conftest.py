@@ -0,0 +1,260 @@
+import json
+import os
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Point the database and snapshot store at a scratch directory before the app
+# modules are imported; the agent also needs a key, though tests never call it
+_scratch = tempfile.mkdtemp(prefix="grocery-ghost-tests-")
+os.environ["DATABASE_PATH"] = os.path.join(_scratch, "test.db")
+os.environ["SNAPSHOT_DIR"] = os.path.join(_scratch, "snapshots")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+# Parse inline; test_cpu exercises the real process pool
+os.environ["CPU_WORKERS"] = "0"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from database import Base, SessionLocal, engine  # noqa: E402
+from models import PageSnapshot, ScrapeSession, SessionStatus  # noqa: E402
+from schemas import ProductSchema  # noqa: E402
+from scraper import insert_products, product_row  # noqa: E402
+from snapshots import snapshot_store  # noqa: E402
+
+# Pages shaped like a typical store's product and category templates
+HEADER = '<header class="site-header"><nav class="main-nav"><a href="/">Home</a></nav></header>'
+FOOTER = '<footer class="site-footer"><p class="legal">Example Shop</p></footer>'
+
+PRODUCTS = [
+    ("Whole Milk", "$3.49", "1L", "Dairy"),
+    ("Free Range Eggs", "$4.99", "12 pack", "Dairy"),
+    ("Sourdough Loaf", "$5.25", "800g", "Bakery"),
+    ("Gala Apples", "$2.99", "1kg", "Produce"),
+    ("Greek Yogurt", "$1.89", "500g", "Dairy"),
+    ("Cheddar Cheese", "$6.40", "400g", "Dairy"),
+]
+
+
+def product_page(name, price, size, category, jsonld=False):
+    structured = (
+        '<script type="application/ld+json">{"@type": "Product", "name": "%s"}</script>' % name
+        if jsonld
+        else ""
+    )
+    return f"""<html><head>{structured}</head><body>{HEADER}
+    <main class="product-detail">
+      <div class="breadcrumbs"><span class="crumb">{category}</span></div>
+      <h1 class="product-title">{name}</h1>
+      <div class="price-box"><span class="price">{price}</span></div>
+      <span class="unit-size">{size}</span>
+      <div class="gallery"><img class="hero" src="/img/{name.replace(' ', '-')}.jpg"></div>
+      <button class="add-to-cart">Add to cart</button>
+    </main>{FOOTER}</body></html>"""
+
+
+def category_page(title, tiles):
+    items = "".join(
+        f'<li class="tile"><a class="tile-name">{name}</a><span class="price">{price}</span></li>'
+        for name, price in tiles
+    )
+    return f"""<html><body>{HEADER}
+    <main class="listing"><h1 class="product-title">{title}</h1>
+      <ul class="grid">{items}</ul>
+    </main>{FOOTER}</body></html>"""
+
+
+def sample(name, price, size, category, jsonld=False):
+    url = f"https://shop.example.com/product/{name.lower().replace(' ', '-')}"
+    html = product_page(name, price, size, category, jsonld)
+    product = ProductSchema(
+        url=url,
+        name=name,
+        current_price=price,
+        unit_size=size,
+        category=category,
+        image_url=f"https://shop.example.com/img/{name.replace(' ', '-')}.jpg",
+    )
+    return html, url, product
+
+
+# Page bodies as a streaming requests response hands them to read_page
+class FakeRaw:
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.reads = 0
+
+    def read1(self, amount, decode_content=True):
+        assert not decode_content
+        self.reads += 1
+        return self.chunks.pop(0) if self.chunks else b""
+
+
+class FakeResponse:
+    def __init__(self, body, headers=None, chunk_size=1024):
+        chunks = [body[i : i + chunk_size] for i in range(0, len(body), chunk_size)]
+        self.raw = FakeRaw(chunks)
+        self.headers = {"Content-Type": "text/html; charset=utf-8", **(headers or {})}
+
+
+PRODUCT_LD = {
+    "@context": "https://schema.org",
+    "@type": "Product",
+    "name": "Whole Milk 1L",
+    "image": ["https://shop.example.com/milk.jpg"],
+    "category": "Dairy > Milk",
+    "offers": {"@type": "Offer", "price": "3.49", "priceCurrency": "USD"},
+}
+PAGE = (
+    b"<html><head><title>Milk</title>"
+    + b'<script type="application/ld+json">'
+    + json.dumps(PRODUCT_LD).encode()
+    + b"</script></head><body>"
+    + b"<div>" * 5000
+    + b"</body></html>"
+)
+
+# What the stand-in proxy serves for /sitemap.xml unless a test overrides it
+SITEMAP = (
+    '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+    "<url><loc>http://shop.test/product/milk</loc></url>"
+    "<url><loc>http://shop.test/product/eggs</loc></url></urlset>"
+)
+
+
+class RecordingExecutor:
+    """Stands in for scrape_executor; records jobs instead of running them"""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args):
+        self.jobs.append((fn, args))
+
+
+@pytest.fixture
+def client():
+    """A TestClient whose database is emptied after each test"""
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    import routes
+
+    recording = RecordingExecutor()
+    monkeypatch.setattr(routes, "scrape_executor", recording)
+    return recording
+
+
+@pytest.fixture
+def db(client):
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def add_session(db):
+    """Factory for sessions, optionally holding products and archived pages.
+
+    products is either a count of generated products or a list of
+    (path, name, current_price, original_price, category) tuples;
+    snapshots is a list of (url, content) pairs.
+    """
+    def add(
+        store="shop.example.com",
+        products=(),
+        snapshots=(),
+        started_at=None,
+        status=SessionStatus.COMPLETED,
+    ):
+        session = ScrapeSession(url=f"https://{store}", name=store, status=status)
+        if started_at:
+            session.started_at = started_at
+        db.add(session)
+        db.commit()
+        if isinstance(products, int):
+            products = [
+                (f"/product/{i}", f"Product {i}", f"${i + 1}.00", None, "Dairy")
+                for i in range(products)
+            ]
+        rows = []
+        for path, name, price, original, category in products:
+            url = f"https://{store}{path}"
+            product = ProductSchema(
+                url=url, name=name, current_price=price, original_price=original, category=category
+            )
+            rows.append(product_row(product, session.id, url))
+        insert_products(db, rows[:2])  # Two batches, so the aggregates are built incrementally
+        insert_products(db, rows[2:])
+        for url, content in snapshots:
+            db.add(
+                PageSnapshot(
+                    session_id=session.id,
+                    url=url,
+                    content_hash=snapshot_store.put(content),
+                    encoding="utf-8",
+                )
+            )
+        db.commit()
+        return session.id
+
+    return add
+
+
+class StandInProxy(BaseHTTPRequestHandler):
+    """Forward proxy stand-in: answers absolute-form requests as the origin would"""
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.server.status != 200:
+            self.send_error(self.server.status)
+            return
+        if self.path in self.server.files:
+            body = self.server.files[self.path]
+            if body is None:
+                self.send_error(404)
+                return
+            content_type = "application/xml"
+        elif self.path.endswith("/robots.txt"):
+            body, content_type = b"Sitemap: http://shop.test/sitemap.xml\n", "text/plain"
+        elif self.path.endswith("/sitemap.xml"):
+            body, content_type = self.server.sitemap.encode(), "application/xml"
+        else:
+            body, content_type = f"<html><body>{self.path}</body></html>".encode(), "text/html"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in_proxy():
+    servers = []
+
+    def start(status=200):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StandInProxy)
+        server.status = status
+        server.sitemap = SITEMAP
+        server.files = {}  # URL -> body served for it, or None for a 404
+        server.requests = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,127 @@
+from analytics import backfill_analytics, parse_price, product_key
+from models import Product, ScrapeSession, SessionStats
+
+
+def test_parse_price_handles_common_formats():
+    assert parse_price("$3.49") == 3.49
+    assert parse_price("£1,299.00") == 1299.0
+    assert parse_price("3,49 €") == 3.49
+    assert parse_price("1.299,00 €") == 1299.0
+    assert parse_price("1 299,00 €") == 1299.0
+    assert parse_price("1.299") == 1299.0
+    assert parse_price("0.125") == 0.125
+    assert parse_price("Price unavailable") is None
+
+
+def test_parse_price_stops_at_a_trailing_size():
+    assert parse_price("$3.49 500g") == 3.49
+    assert parse_price("3,49 € 1 kg") == 3.49
+    assert parse_price("$12 for 2") == 12.0
+
+
+def test_product_key_ignores_scheme_host_and_tracking():
+    assert product_key("https://www.shop.example.com/Product/Milk/?utm_source=x") == product_key(
+        "http://shop.example.com/product/milk"
+    )
+
+
+def test_session_analytics_are_kept_up_to_date(client, add_session):
+    session_id = add_session(
+        products=[
+            ("/product/milk", "Milk", "$3.00", "$4.00", "Dairy"),
+            ("/product/eggs", "Eggs", "$5.00", None, "Dairy"),
+            ("/product/bread", "Bread", "$2.00", "$2.50", "Bakery"),
+            ("/product/gift-card", "Gift Card", None, None, None),
+        ],
+    )
+
+    analytics = client.get(f"/api/session/{session_id}/analytics").json()
+
+    assert analytics["product_count"] == 4
+    assert analytics["priced_count"] == 3
+    assert (analytics["price_min"], analytics["price_median"], analytics["price_max"]) == (
+        2.0,
+        3.0,
+        5.0,
+    )
+    assert analytics["discount_count"] == 2
+    assert analytics["categories"] == [
+        {"category": "Dairy", "product_count": 2},
+        {"category": None, "product_count": 1},
+        {"category": "Bakery", "product_count": 1},
+    ]
+
+
+def test_diff_lists_added_removed_and_repriced_products(client, add_session):
+    before = add_session(
+        products=[
+            ("/product/milk", "Milk", "$3.00", None, "Dairy"),
+            ("/product/eggs", "Eggs", "$5.00", None, "Dairy"),
+            ("/product/bread", "Bread", "$2.00", None, "Bakery"),
+        ],
+    )
+    after = add_session(
+        products=[
+            ("/product/milk/", "Milk", "$3.60", None, "Dairy"),
+            ("/product/eggs", "Eggs", "$5.00", None, "Dairy"),
+            ("/product/butter", "Butter", "$4.00", None, "Dairy"),
+        ],
+    )
+
+    diff = client.get(f"/api/session/{after}/diff/{before}").json()
+
+    assert diff["counts"] == {"added": 1, "removed": 1, "price_changed": 1}
+    assert [p["name"] for p in diff["added"]] == ["Butter"]
+    assert [p["name"] for p in diff["removed"]] == ["Bread"]
+    [change] = diff["price_changed"]
+    assert (change["old_price"], change["new_price"], change["change_percent"]) == (
+        "$3.00",
+        "$3.60",
+        20.0,
+    )
+    assert client.get(f"/api/session/{after}/diff/missing").status_code == 404
+
+
+def test_backfill_keys_and_aggregates_old_products(client, db):
+    session = ScrapeSession(url="https://shop.example.com", name="Example Shop")
+    db.add(session)
+    db.commit()
+    db.add_all(
+        Product(
+            session_id=session.id,
+            url=f"https://shop.example.com/product/{name.lower()}",
+            name=name,
+            current_price=price,
+        )
+        for name, price in [("A", "$1.00"), ("B", "$3.00")]
+    )
+    db.commit()
+
+    backfill_analytics(db)
+
+    assert {p.product_key for p in db.query(Product)} == {"/product/a", "/product/b"}
+    stats = db.get(SessionStats, session.id)
+    assert (stats.product_count, stats.price_min, stats.price_max) == (2, 1.0, 3.0)
+
+
+def test_new_indexes_are_built_by_ensure_indexes_not_at_startup(client):
+    import threading
+
+    from sqlalchemy import inspect, text
+
+    from database import engine, ensure_indexes, ensure_schema
+
+    def index_names():
+        return {index["name"] for index in inspect(engine).get_indexes("products")}
+
+    # Let the startup migration thread finish first
+    for thread in threading.enumerate():
+        if thread.name == "migrations":
+            thread.join(5)
+    with engine.begin() as connection:
+        connection.execute(text("DROP INDEX idx_products_session_price"))
+    ensure_schema()
+    assert "idx_products_session_price" not in index_names()
+
+    ensure_indexes()
+    assert "idx_products_session_price" in index_names()
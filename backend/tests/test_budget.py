@@ -0,0 +1,118 @@
+import budget
+from budget import (
+    LLM_CHARS_PER_TOKEN,
+    LLM_OUTPUT_TOKENS_ESTIMATE,
+    LLM_PROMPT_OVERHEAD_TOKENS,
+    STOP_CANCELED,
+    STOP_MAX_LLM_TOKENS,
+    STOP_MAX_PAGES,
+    STOP_MAX_PRODUCTS,
+    STOP_MAX_SECONDS,
+    STOP_MAX_SPEND,
+    ScrapeBudget,
+)
+from cancellation import CancellationToken
+
+PROMPT_CHARS = 4000
+ESTIMATE = (
+    PROMPT_CHARS // LLM_CHARS_PER_TOKEN + LLM_PROMPT_OVERHEAD_TOKENS + LLM_OUTPUT_TOKENS_ESTIMATE
+)
+
+
+def test_admit_page_stops_at_max_pages():
+    limits = ScrapeBudget(max_pages=2)
+    assert limits.admit_page() and limits.admit_page()
+    assert not limits.stopped
+
+    assert not limits.admit_page()
+    assert limits.pages_started == 2
+    assert limits.stopped
+    assert limits.stop_reason == STOP_MAX_PAGES
+
+
+def test_add_product_stops_at_max_products():
+    limits = ScrapeBudget(max_products=2)
+    assert limits.add_product()
+    assert not limits.stopped
+    assert limits.add_product()
+    assert limits.stopped
+    assert limits.stop_reason == STOP_MAX_PRODUCTS
+
+    # Products found by pages already in flight fall outside the limit
+    assert not limits.add_product()
+    assert limits.products == 2
+    assert not limits.admit_page()
+
+
+def test_reserve_llm_call_refuses_over_the_token_cap():
+    limits = ScrapeBudget(max_llm_tokens=ESTIMATE * 2)
+    first = limits.reserve_llm_call(PROMPT_CHARS)
+    second = limits.reserve_llm_call(PROMPT_CHARS)
+    assert first == second == ESTIMATE
+
+    # Reservations in flight count against the cap
+    assert limits.reserve_llm_call(PROMPT_CHARS) is None
+    assert limits.stopped
+    assert limits.stop_reason == STOP_MAX_LLM_TOKENS
+    # Stopped budgets refuse everything, even after the reservations are released
+    limits.record_llm_usage(first, 0)
+    assert limits.reserve_llm_call(1) is None
+
+
+def test_reserve_llm_call_refuses_over_the_spend_cap():
+    cost = ESTIMATE / 1_000_000 * budget.LLM_COST_PER_MILLION_TOKENS
+    limits = ScrapeBudget(max_spend=cost * 1.5)
+    assert limits.reserve_llm_call(PROMPT_CHARS) == ESTIMATE
+
+    assert limits.reserve_llm_call(PROMPT_CHARS) is None
+    assert limits.stop_reason == STOP_MAX_SPEND
+
+
+def test_record_bytes_stops_at_the_spend_cap():
+    limits = ScrapeBudget(max_spend=budget.PROXY_COST_PER_GB)
+    limits.record_bytes(999_000_000)
+    assert not limits.stopped
+    limits.record_bytes(1_000_000)
+    assert limits.stopped
+    assert limits.stop_reason == STOP_MAX_SPEND
+
+
+def test_record_llm_usage_calibrates_later_estimates():
+    limits = ScrapeBudget()
+    reservation = limits.reserve_llm_call(PROMPT_CHARS)
+    # The call used twice what was estimated
+    limits.record_llm_usage(reservation, reservation * 2)
+    assert limits.llm_tokens == ESTIMATE * 2
+
+    assert limits.reserve_llm_call(PROMPT_CHARS) == ESTIMATE * 2
+
+    # Failed calls (no usage) release their reservation without skewing calibration
+    calibrated = ScrapeBudget()
+    calibrated.record_llm_usage(calibrated.reserve_llm_call(PROMPT_CHARS), 0)
+    assert calibrated.llm_tokens == 0
+    assert calibrated.reserve_llm_call(PROMPT_CHARS) == ESTIMATE
+
+
+def test_deadline_stops_the_budget(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(budget.time, "monotonic", lambda: now[0])
+    limits = ScrapeBudget(max_seconds=30)
+    limits.start()
+    assert limits.admit_page()
+
+    now[0] += 30
+    assert limits.stopped
+    assert limits.stop_reason == STOP_MAX_SECONDS
+    assert not limits.admit_page()
+    assert limits.reserve_llm_call(PROMPT_CHARS) is None
+
+
+def test_cancelled_token_stops_the_budget_and_first_reason_wins():
+    limits = ScrapeBudget(max_pages=1)
+    limits.token = CancellationToken()
+    limits.token.cancel()
+
+    assert not limits.admit_page()
+    assert limits.stop_reason == STOP_CANCELED
+    limits.stop(STOP_MAX_PAGES)
+    assert limits.stop_reason == STOP_CANCELED
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+import pytest
+
+from cancellation import (
+    CANCEL_DELETED,
+    CancellationToken,
+    ScrapeCancelled,
+    get_token,
+    register_scrape,
+    release_scrape,
+)
+from models import ScrapeSession, SessionStatus
+from scraper import finish_session
+
+
+class Closable:
+    def __init__(self):
+        self.closed = 0
+
+    def close(self):
+        self.closed += 1
+
+
+def test_cancel_closes_registered_resources_once():
+    token = CancellationToken()
+    kept, released = Closable(), Closable()
+    token.register(kept)
+    token.register(released)
+    token.unregister(released)
+
+    token.cancel(CANCEL_DELETED)
+    token.cancel()
+
+    assert (kept.closed, released.closed) == (1, 0)
+    assert token.reason == CANCEL_DELETED
+    with pytest.raises(ScrapeCancelled):
+        token.raise_if_cancelled()
+
+    # Registered after the fact: closed straight away
+    late = token.register(Closable())
+    assert late.closed == 1
+
+
+def test_run_cancels_the_awaited_coroutine():
+    token = CancellationToken()
+    finished = []
+
+    async def slow():
+        await asyncio.sleep(10)
+        finished.append(True)
+
+    async def main():
+        # Cancelled from another thread, as the cancel endpoint does
+        threading.Timer(0.05, token.cancel).start()
+        await token.run(slow())
+
+    with pytest.raises(ScrapeCancelled):
+        asyncio.run(asyncio.wait_for(main(), 5))
+    assert finished == []
+
+
+def test_cancel_endpoint_marks_session_canceled(client, db):
+    session = ScrapeSession(url="https://shop.example.com", status=SessionStatus.IN_PROGRESS)
+    db.add(session)
+    db.commit()
+    session_id = str(session.id)
+    token = register_scrape(session_id)
+
+    try:
+        response = client.post(f"/api/session/{session_id}/cancel")
+        assert response.status_code == 200
+        assert token.cancelled
+
+        # The scrape finishing after its last cancellation check must not win
+        assert not finish_session(db, session_id, SessionStatus.COMPLETED)
+        db.expire_all()
+        assert db.get(ScrapeSession, session_id).status == SessionStatus.CANCELED
+
+        assert client.post(f"/api/session/{session_id}/cancel").status_code == 409
+    finally:
+        release_scrape(session_id)
+    assert get_token(session_id) is None
+
+
+def test_finish_session_records_status_while_in_progress(client, db):
+    session = ScrapeSession(url="https://shop.example.com", status=SessionStatus.IN_PROGRESS)
+    db.add(session)
+    db.commit()
+
+    assert finish_session(db, session.id, SessionStatus.COMPLETED, stop_reason="done")
+    db.expire_all()
+    session = db.get(ScrapeSession, session.id)
+    assert (session.status, session.stop_reason) == (SessionStatus.COMPLETED, "done")
+    assert session.completed_at is not None
@@ -0,0 +1,40 @@
+import asyncio
+
+import cpu
+from conftest import PRODUCTS, category_page, sample
+from pages import page_text_and_fingerprint
+from sitemaps import parse_sitemap_content
+from templates import learn_template
+
+SITEMAP = (
+    '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+    "<url><loc>https://shop.example.com/product/apple</loc></url></urlset>"
+)
+
+
+def test_cpu_work_runs_in_worker_processes(monkeypatch):
+    monkeypatch.setattr(cpu, "CPU_WORKERS", 2)
+    monkeypatch.setattr(cpu, "_executor", None)
+    negatives = [category_page("Bakery", [("Rye Bread", "$4.00"), ("Bagels", "$3.00")])]
+    template = learn_template(
+        [sample(*product, jsonld=True) for product in PRODUCTS[:5]], negatives
+    )
+    html, url, expected = sample(*PRODUCTS[5], jsonld=True)
+
+    async def run():
+        return await asyncio.gather(
+            cpu.run_cpu(page_text_and_fingerprint, html, store="a"),
+            cpu.run_cpu(parse_sitemap_content, SITEMAP, "shop.example.com", store="a"),
+            cpu.run_cpu(template.extract, html, url, store="b"),
+        )
+
+    try:
+        fingerprinted, (urls, _), product = asyncio.run(run())
+    finally:
+        cpu.shutdown_cpu_executor()
+
+    assert fingerprinted == page_text_and_fingerprint(html)
+    assert "https://shop.example.com/product/apple" in urls
+    assert product.name == expected.name
+    assert product.current_price == expected.current_price
+    assert cpu.cpu_scheduler.stats()["in_use"] == 0
@@ -0,0 +1,170 @@
+from canonical import canonicalize_url
+from fingerprints import NearDuplicateIndex, hamming_distance, simhash
+from schemas import UrlRules
+
+# Cleaned text of a typical page: navigation and footer around the product copy
+NAVIGATION = " ".join(f"aisle{i} offers{i}" for i in range(60))
+FOOTER = " ".join(f"help{i} policy{i}" for i in range(60))
+PAGE = (
+    f"{NAVIGATION} Whole Milk 1L. Fresh whole milk from local farms, pasteurised "
+    "and homogenised. Keep refrigerated and use within three days of opening. "
+    "Ingredients: milk. Allergens: contains milk. Price $3.49 per bottle. "
+    f"Add to cart. Delivery available in your area from tomorrow morning. {FOOTER}"
+)
+
+
+def test_canonicalization_collapses_trivial_variants():
+    urls = [
+        "https://Shop.Example.com/product/milk",
+        "https://shop.example.com:443/product/milk/",
+        "https://shop.example.com/product/milk?utm_source=mail&gclid=abc",
+        "https://shop.example.com/product/milk#reviews",
+    ]
+    assert {canonicalize_url(url) for url in urls} == {"https://shop.example.com/product/milk"}
+
+
+def test_canonicalization_keeps_meaningful_params_sorted():
+    url = "https://shop.example.com/product?sku=2&id=1&utm_medium=x"
+    assert canonicalize_url(url) == "https://shop.example.com/product?id=1&sku=2"
+
+
+def test_store_rules():
+    rules = UrlRules(
+        strip_params=["variant"], lowercase_path=True, strip_locale_prefix=True
+    )
+    assert (
+        canonicalize_url("https://shop.example.com/en-GB/Product/Milk?variant=2", rules)
+        == "https://shop.example.com/product/milk"
+    )
+    only_id = UrlRules(keep_params=["id"])
+    assert (
+        canonicalize_url("https://shop.example.com/p?id=7&color=red", only_id)
+        == "https://shop.example.com/p?id=7"
+    )
+
+
+def test_simhash_is_close_for_near_duplicates():
+    near = PAGE.replace("tomorrow morning", "tomorrow")
+    other = PAGE.replace(NAVIGATION, " ".join(f"banner{i}" for i in range(120)))
+    assert hamming_distance(simhash(PAGE), simhash(near)) <= 3
+    assert hamming_distance(simhash(PAGE), simhash(other)) > 10
+
+
+def test_index_shares_the_first_pages_result():
+    index = NearDuplicateIndex()
+    future, owner, is_owner = index.claim(simhash(PAGE), "https://shop.example.com/a")
+    assert is_owner
+
+    near = PAGE.replace("tomorrow morning", "tomorrow")
+    shared, owner_url, is_owner = index.claim(simhash(near), "https://shop.example.com/b")
+    assert not is_owner
+    assert shared is future
+    assert owner_url == "https://shop.example.com/a"
+    assert index.duplicates == 1
+
+    _, _, is_owner = index.claim(simhash("Something else entirely " * 5), "https://x/c")
+    assert is_owner
+
+
+def test_near_duplicate_pages_are_extracted_once(monkeypatch):
+    import asyncio
+
+    import scraper
+    from schemas import ProductSchema
+
+    calls = []
+
+    async def fake_extract(html, url, budget=None, text=None):
+        calls.append(url)
+        await asyncio.sleep(0.01)
+        return ProductSchema(url=url, name="Whole Milk 1L", current_price="$3.49"), True
+
+    monkeypatch.setattr(scraper, "_extract_product", fake_extract)
+    monkeypatch.setattr(scraper, "clean_page_text", lambda html: html)
+
+    async def run():
+        index = NearDuplicateIndex()
+        near = PAGE.replace("tomorrow morning", "tomorrow")
+        variant = PAGE.replace("$3.49", "$5.99")
+        return await asyncio.gather(
+            scraper.extract_product(PAGE, "https://x/a", duplicates=index),
+            scraper.extract_product(near, "https://x/b", duplicates=index),
+            scraper.extract_product(variant, "https://x/c", duplicates=index),
+        )
+
+    first, duplicate, variant = asyncio.run(run())
+
+    assert first.url == "https://x/a"
+    assert duplicate is None
+    # Same page text but a different price: extracted on its own
+    assert calls == ["https://x/a", "https://x/c"]
+    assert variant.url == "https://x/c"
+
+
+def test_variant_with_a_different_price_does_not_match():
+    from scraper import _matches_text
+    from schemas import ProductSchema
+
+    product = ProductSchema(url="https://x/a", name="Whole Milk 1L", current_price="$3.49")
+    # The old digit-stream check found "349" in the SKU and review count
+    variant = PAGE.replace("$3.49", "$5.99") + " SKU 134901, 349 reviews"
+
+    assert _matches_text(product, PAGE)
+    assert not _matches_text(product, variant)
+    assert _matches_text(product, PAGE.replace("Price $3.49", "Price 3.49"))
+
+
+def test_near_duplicate_variant_with_a_different_price_is_re_extracted(monkeypatch):
+    import asyncio
+
+    import scraper
+    from schemas import ProductSchema
+
+    calls = []
+
+    async def fake_extract(html, url, budget=None, text=None):
+        calls.append(url)
+        price = "$3.49" if "$3.49" in html else "$5.99"
+        return ProductSchema(url=url, name="Whole Milk 1L", current_price=price), True
+
+    monkeypatch.setattr(scraper, "_extract_product", fake_extract)
+    monkeypatch.setattr(scraper, "clean_page_text", lambda html: html)
+
+    async def run():
+        index = NearDuplicateIndex()
+        # Still a near-duplicate, and its SKU holds the digits of the first price
+        variant = PAGE.replace("$3.49", "$5.99") + " SKU 3490"
+        first = await scraper.extract_product(PAGE, "https://x/a", duplicates=index)
+        second = await scraper.extract_product(variant, "https://x/b", duplicates=index)
+        return first, second
+
+    first, variant = asyncio.run(run())
+
+    assert calls == ["https://x/a", "https://x/b"]
+    assert (first.current_price, variant.current_price) == ("$3.49", "$5.99")
+
+
+def test_discovery_fetches_the_listed_url_and_dedupes_on_the_canonical_one(stand_in_proxy):
+    import asyncio
+
+    from proxies import ProxyPool
+    from sitemaps import UrlFeed, discover_product_urls
+
+    server, url = stand_in_proxy()
+    server.sitemap = (
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        "<url><loc>http://shop.test/product/milk/</loc></url>"
+        "<url><loc>http://shop.test/product/milk</loc></url>"
+        "<url><loc>http://shop.test/product/eggs/?utm_source=feed</loc></url></urlset>"
+    )
+    feed = UrlFeed()
+    asyncio.run(
+        discover_product_urls("http://shop.test", "shop.test", feed, proxies=ProxyPool([url]))
+    )
+    feed.close()
+
+    # WooCommerce-style slashes survive; only the spelling variant is dropped
+    assert list(iter(feed.get, None)) == [
+        "http://shop.test/product/milk/",
+        "http://shop.test/product/eggs/?utm_source=feed",
+    ]
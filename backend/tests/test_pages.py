@@ -0,0 +1,76 @@
+import gzip
+import json
+import zlib
+
+import pytest
+
+from conftest import PAGE, PRODUCT_LD, FakeResponse
+from pages import SkippedPage, product_from_jsonld, read_page
+
+
+def test_gzip_is_decoded_and_wire_bytes_counted():
+    body = b"<html><body>" + b"<p>milk</p>" * 2000 + b"</body></html>"
+    compressed = gzip.compress(body)
+    page = read_page(FakeResponse(compressed, {"Content-Encoding": "gzip"}))
+    assert page.content == body
+    assert page.wire_bytes == len(compressed)
+    assert not page.truncated
+
+
+@pytest.mark.parametrize("wbits", [zlib.MAX_WBITS, -zlib.MAX_WBITS])
+def test_deflate_wrapped_or_raw(wbits):
+    body = b"<html><body>" + b"<p>eggs</p>" * 500 + b"</body></html>"
+    compressor = zlib.compressobj(wbits=wbits)
+    compressed = compressor.compress(body) + compressor.flush()
+    page = read_page(FakeResponse(compressed, {"Content-Encoding": "deflate"}))
+    assert page.content == body
+
+
+def test_body_is_capped():
+    response = FakeResponse(b"<html>" + b"x" * 100_000, chunk_size=4096)
+    page = read_page(response, max_bytes=10_000)
+    assert page.truncated
+    assert len(page.content) == 10_000
+    assert response.raw.chunks  # The rest was never read
+
+
+def test_non_html_is_skipped_before_reading():
+    response = FakeResponse(b"%PDF-1.7", {"Content-Type": "application/pdf"})
+    with pytest.raises(SkippedPage):
+        read_page(response)
+    assert response.raw.reads == 0
+
+
+def test_read_stops_at_complete_jsonld_product():
+    response = FakeResponse(PAGE, chunk_size=64)
+    page = read_page(response)
+    assert page.jsonld_product["name"] == "Whole Milk 1L"
+    assert response.raw.chunks  # The body after the block was never read
+    assert len(page.content) < len(PAGE)
+
+
+def test_product_from_jsonld():
+    product = product_from_jsonld(PRODUCT_LD, "https://shop.example.com/p/milk")
+    assert product.name == "Whole Milk 1L"
+    assert product.current_price == "$3.49"
+    assert product.category == "Milk"
+    assert product.image_url == "https://shop.example.com/milk.jpg"
+
+
+def test_product_without_price_does_not_stop_the_read():
+    no_price = {"@type": "Product", "name": "Milk"}
+    body = (
+        b'<html><head><script type="application/ld+json">'
+        + json.dumps(no_price).encode()
+        + b"</script></head><body>rest</body></html>"
+    )
+    page = read_page(FakeResponse(body, chunk_size=16))
+    assert page.jsonld_product is None
+    assert page.content == body
+
+
+def test_archived_pages_are_read_past_the_jsonld_product():
+    response = FakeResponse(PAGE, chunk_size=64)
+    page = read_page(response, early_exit=False)
+    assert page.jsonld_product["name"] == "Whole Milk 1L"
+    assert page.content == PAGE
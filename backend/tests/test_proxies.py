@@ -0,0 +1,98 @@
+import asyncio
+
+import scraper
+from proxies import PROXY_COOLDOWN_AFTER, PROXY_COOLDOWN_SECONDS, ProxyPool
+from sitemaps import UrlFeed, discover_product_urls
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def route_once(pool, host, seconds, ok):
+    with pool.route(host) as route:
+        if ok:
+            route.succeeded(seconds)
+        else:
+            route.failed(seconds)
+        return route.proxy.name
+
+
+def test_failing_proxy_cools_down_then_recovers():
+    clock = FakeClock()
+    pool = ProxyPool(["http://a.test:1", "http://b.test:1"], clock=clock)
+    for _ in range(PROXY_COOLDOWN_AFTER):
+        with pool.route("shop.test", exclude=[pool.proxies[1]]) as route:
+            route.failed(10)
+
+    assert {route_once(pool, "shop.test", 0.1, True) for _ in range(5)} == {"http://b.test:1"}
+    assert pool.stats()["http://a.test:1"]["cooldown_seconds"] == PROXY_COOLDOWN_SECONDS
+
+    clock.now += PROXY_COOLDOWN_SECONDS + 1
+    # Back from the cooldown: a gets a probe, and a clean record once it succeeds
+    assert route_once(pool, "shop.test", 0.1, True) == "http://a.test:1"
+
+
+def test_host_cooldown_only_affects_that_host():
+    pool = ProxyPool(["http://a.test:1", "direct"], clock=FakeClock())
+    a = pool.proxies[0]
+    for _ in range(PROXY_COOLDOWN_AFTER):
+        with pool.route("blocked.test", exclude=[pool.proxies[1]]) as route:
+            route.failed(0.1)
+    # Successes elsewhere keep the proxy itself healthy
+    with pool.route("other.test", exclude=[pool.proxies[1]]) as route:
+        route.succeeded(0.1)
+
+    with pool.route("blocked.test") as route:
+        assert route.proxy.name == "direct"
+    with pool.route("other.test", exclude=[pool.proxies[1]]) as route:
+        assert route.proxy is a
+    assert pool.stats()["http://a.test:1"]["hosts_cooling"] == ["blocked.test"]
+
+
+def test_pinned_host_sticks_to_its_proxy_while_healthy():
+    pool = ProxyPool(["http://a.test:1", "http://b.test:1"], clock=FakeClock())
+    pool.pin("shop.test")
+    first = route_once(pool, "shop.test", 2.0, True)
+    # The other proxy is faster, but the host stays where it is
+    route_once(pool, "elsewhere.test", 0.01, True)
+    assert {route_once(pool, "shop.test", 2.0, True) for _ in range(5)} == {first}
+
+    for _ in range(PROXY_COOLDOWN_AFTER):
+        route_once(pool, "shop.test", 2.0, False)
+    assert route_once(pool, "shop.test", 0.1, True) != first
+    pool.unpin("shop.test")
+    assert pool.stats()[first]["in_flight"] == 0
+
+
+def test_fetch_fails_over_to_a_healthy_proxy(monkeypatch, stand_in_proxy):
+    bad, bad_url = stand_in_proxy(status=502)
+    good, good_url = stand_in_proxy()
+    pool = ProxyPool([bad_url, good_url])
+    monkeypatch.setattr(scraper, "proxy_pool", pool)
+
+    # Both untried; the bad one is listed first and so is tried first
+    body = scraper.fetch("http://shop.test/product/milk", lambda response: response.text)
+
+    assert "http://shop.test/product/milk" in body
+    assert bad.requests == ["http://shop.test/product/milk"]
+    stats = pool.stats()
+    assert stats[bad_url]["error_rate"] > 0
+    assert stats[good_url]["error_rate"] == 0
+
+
+def test_discovery_goes_through_the_pool(stand_in_proxy):
+    server, url = stand_in_proxy()
+    pool = ProxyPool([url])
+    feed = UrlFeed()
+    asyncio.run(
+        discover_product_urls("http://shop.test", "shop.test", feed, proxies=pool)
+    )
+
+    assert feed.count == 2
+    assert "http://shop.test/robots.txt" in server.requests
+    assert pool.stats()[url]["requests"] == 2  # robots.txt and the sitemap
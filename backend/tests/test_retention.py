@@ -0,0 +1,141 @@
+import json
+from datetime import datetime, timedelta
+
+import pyarrow.parquet as pq
+
+import retention
+from database import delete_in_chunks, engine
+from models import Product, ScrapeSession, SessionCategory, SessionStats, SessionStatus
+from retention import (
+    archive_session,
+    expired_sessions,
+    janitor,
+    maintain_database,
+    vacuum_database,
+)
+
+NOW = datetime(2026, 6, 1)
+
+
+def days_ago(days):
+    return NOW - timedelta(days=days)
+
+
+def test_expired_sessions_keep_newest_per_store_or_recent(client, db, add_session):
+    a_new, a_mid, a_old = (
+        add_session("a.example.com", started_at=days_ago(days)) for days in (1, 10, 40)
+    )
+    b_old = add_session("b.example.com", started_at=days_ago(60))
+    running = add_session(
+        "b.example.com", started_at=days_ago(90), status=SessionStatus.IN_PROGRESS
+    )
+
+    assert expired_sessions(db, NOW, keep=1, max_age_days=0) == [a_old, a_mid]
+    assert expired_sessions(db, NOW, keep=0, max_age_days=30) == [b_old, a_old]
+    # Kept while either limit still covers it
+    assert expired_sessions(db, NOW, keep=1, max_age_days=30) == [a_old]
+    assert expired_sessions(db, NOW, keep=0, max_age_days=0) == []
+    assert running not in expired_sessions(db, NOW, keep=1, max_age_days=1)
+    assert a_new not in expired_sessions(db, NOW, keep=1, max_age_days=1)
+
+
+def test_archive_session_writes_products_and_session(client, db, tmp_path, add_session):
+    session_id = add_session(products=25)
+
+    path = archive_session(db, session_id, tmp_path)
+
+    table = pq.read_table(path)
+    assert table.num_rows == 25
+    assert sorted(table.column("price_value").to_pylist()) == [float(i) for i in range(1, 26)]
+    session = json.loads(table.schema.metadata[b"session"])
+    assert session["id"] == session_id
+    assert session["status"] == "completed"
+    assert session["stats"]["product_count"] == 25
+
+
+def test_delete_in_chunks_removes_every_row(client, db, add_session):
+    session_id = add_session(products=7)
+    other_id = add_session("b.example.com", products=3)
+
+    assert delete_in_chunks(db, "products", session_id, chunk=2, pause=0) == 7
+    assert db.query(Product).filter(Product.session_id == session_id).count() == 0
+    assert db.query(Product).filter(Product.session_id == other_id).count() == 3
+
+
+def test_delete_hides_session_and_purges_it_in_background(client, db, add_session):
+    session_id = add_session(products=5)
+
+    assert client.delete(f"/api/session/{session_id}").status_code == 200
+    assert session_id not in [s["id"] for s in client.get("/api/sessions").json()["sessions"]]
+    assert client.get(f"/api/session/{session_id}").status_code == 404
+    assert janitor.wait(5)
+
+    assert db.query(ScrapeSession).count() == 0
+    for model in (Product, SessionStats, SessionCategory):
+        assert db.query(model).count() == 0
+    assert janitor.stats()["pending_deletions"] == 0
+
+
+def test_sweep_archives_then_deletes_expired_sessions(
+    client, db, tmp_path, monkeypatch, add_session
+):
+    monkeypatch.setattr(retention, "RETENTION_KEEP_SESSIONS", 1)
+    old_id = add_session(started_at=days_ago(10), products=3)
+    new_id = add_session(started_at=days_ago(1), products=3)
+
+    assert janitor.sweep(tmp_path) == [old_id]
+    assert janitor.wait(5)
+
+    assert [s.id for s in db.query(ScrapeSession)] == [new_id]
+    [archive] = tmp_path.glob("*/*.parquet")
+    assert archive.stem == old_id
+    assert pq.read_table(archive).num_rows == 3
+
+
+def test_maintain_database_runs_on_live_database(client, db, add_session):
+    add_session(products=5)
+
+    maintain_database(lambda: True)
+
+    assert db.query(Product).count() == 5
+
+
+def test_maintain_database_frees_pages_only_while_idle(client, db, add_session):
+    vacuum_database()  # The explicit conversion; a no-op rewrite on the test file
+
+    def free_pages():
+        with engine.connect() as connection:
+            return connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+
+    session_id = add_session(products=2000)
+    delete_in_chunks(db, "products", session_id, pause=0)
+    free = free_pages()
+    assert free > 0
+
+    maintain_database(lambda: False)
+    assert free_pages() == free
+    maintain_database(lambda: True)
+    assert free_pages() == 0
+
+
+def test_sessions_being_deleted_are_gone_from_every_route(client, monkeypatch, add_session):
+    session_id = add_session(products=3)
+    other_id = add_session("b.example.com", products=3)
+    # Keep the janitor from purging it, so the routes see it mid-deletion
+    monkeypatch.setattr(janitor, "delete", lambda session_id: None)
+
+    assert client.delete(f"/api/session/{session_id}").status_code == 200
+
+    for request in (
+        ("get", f"/api/session/{session_id}"),
+        ("get", f"/api/session/{session_id}/products"),
+        ("get", f"/api/session/{session_id}/analytics"),
+        ("get", f"/api/session/{session_id}/diff/{other_id}"),
+        ("get", f"/api/session/{other_id}/diff/{session_id}"),
+        ("get", f"/api/session/{session_id}/export"),
+        ("post", f"/api/session/{session_id}/reextract"),
+        ("post", f"/api/session/{session_id}/cancel"),
+    ):
+        method, path = request
+        assert getattr(client, method)(path).status_code == 404, path
+    assert client.get(f"/api/session/{other_id}/products").status_code == 200
@@ -0,0 +1,144 @@
+import scraper
+from models import ScrapeSession, SessionStatus
+from scraper import scrape_store, validate_and_scrape
+
+
+async def fake_validate_url(url):
+    return "https://shop.example.com", "shop.example.com", "Example Shop"
+
+
+def test_scrape_creates_session_and_queues_job(client, executor, db, monkeypatch):
+    monkeypatch.setattr(scraper, "validate_url", fake_validate_url)
+
+    response = client.post("/api/scrape", json={"url": "https://shop.example.com/"})
+
+    assert response.status_code == 200
+    session_id = response.json()["session_id"]
+    session = db.query(ScrapeSession).filter(ScrapeSession.id == session_id).one()
+    assert session.status == SessionStatus.QUEUED
+    assert session.name == "Example Shop"
+
+    [(fn, args)] = executor.jobs
+    assert fn is scrape_store
+    assert args[:3] == (session_id, "https://shop.example.com", "shop.example.com")
+
+
+def test_scrape_rejects_invalid_store(client, executor, db, monkeypatch):
+    async def failing_validate_url(url):
+        raise ValueError("unreachable")
+
+    monkeypatch.setattr(scraper, "validate_url", failing_validate_url)
+
+    response = client.post("/api/scrape", json={"url": "https://shop.example.com/"})
+
+    assert response.status_code == 400
+    assert executor.jobs == []
+    assert db.query(ScrapeSession).count() == 0
+
+
+def test_batch_scrape_queues_every_store(client, executor, db):
+    response = client.post(
+        "/api/scrape/batch",
+        json={
+            "stores": [
+                {"url": "https://a.example.com/"},
+                {"url": "https://b.example.com/", "weight": 3},
+            ]
+        },
+    )
+
+    assert response.status_code == 200
+    sessions = response.json()["sessions"]
+    assert len(sessions) == 2
+    assert db.query(ScrapeSession).count() == 2
+
+    assert [fn for fn, _ in executor.jobs] == [validate_and_scrape] * 2
+    assert [args[0] for _, args in executor.jobs] == [s["session_id"] for s in sessions]
+    assert [args[3] for _, args in executor.jobs] == [1, 3]
+
+
+def test_validate_url_fetches_off_the_event_loop(monkeypatch):
+    import asyncio
+    import threading
+    import time
+
+    fetch_threads = []
+
+    def slow_fetch(url, read, token=None, timeout=None):
+        fetch_threads.append(threading.current_thread())
+        time.sleep(0.2)
+        return "https://shop.example.com/home", "<html><body>Example Shop</body></html>"
+
+    class FailingAgent:
+        async def run(self, prompt):
+            raise RuntimeError("no LLM in tests")
+
+    monkeypatch.setattr(scraper, "fetch", slow_fetch)
+    monkeypatch.setattr(scraper, "gemini_agent", FailingAgent())
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        result = await scraper.validate_url("https://shop.example.com/")
+        ticker.cancel()
+        return result, ticks
+
+    (base_url, netloc, name), ticks = asyncio.run(run())
+
+    assert (base_url, netloc) == ("https://shop.example.com", "shop.example.com")
+    assert name == netloc  # The LLM failed, so the domain stands in
+    assert fetch_threads[0] is not threading.main_thread()
+    assert ticks > 5  # The loop kept running while the page was fetched
+
+
+def test_large_product_pages_stream_the_same_json(client, add_session, monkeypatch):
+    import json
+
+    import responses
+    import routes
+
+    streamed = []
+
+    def recording_stream(payload, query, params):
+        streamed.append(params["limit"])
+        return responses.stream_products_response(payload, query, params)
+
+    monkeypatch.setattr(routes, "stream_products_response", recording_stream)
+    monkeypatch.setattr(responses, "STREAM_CHUNK_ROWS", 64)  # Several chunks per page
+    session_id = add_session(products=responses.STREAM_THRESHOLD + 100)
+    url = f"/api/session/{session_id}/products"
+
+    below = client.get(url, params={"limit": responses.STREAM_THRESHOLD})
+    above = client.get(url, params={"limit": responses.STREAM_THRESHOLD + 1})
+    rest = client.get(url, params={"offset": responses.STREAM_THRESHOLD, "limit": 1})
+
+    assert streamed == [responses.STREAM_THRESHOLD + 1]
+    below, above, rest = (json.loads(r.content) for r in (below, above, rest))
+    assert len(above["products"]) == responses.STREAM_THRESHOLD + 1
+    assert above["products"] == below["products"] + rest["products"]
+    assert [p["name"] for p in above["products"]] == [
+        f"Product {i}" for i in range(responses.STREAM_THRESHOLD + 1)
+    ]
+    assert above["pagination"] == {
+        **below["pagination"],
+        "limit": responses.STREAM_THRESHOLD + 1,
+    }
+    assert above["pagination"]["has_more"]
+
+    # The whole listing, streamed
+    everything = json.loads(client.get(url, params={"limit": 1000}).content)
+    assert streamed[-1] == 1000
+    assert everything["products"][: len(above["products"])] == above["products"]
+    assert everything["pagination"] == {
+        "total": responses.STREAM_THRESHOLD + 100,
+        "offset": 0,
+        "limit": 1000,
+        "has_more": False,
+    }
@@ -0,0 +1,81 @@
+import asyncio
+
+import routing
+import scraper
+from conftest import category_page, product_page
+from routing import PageRouter, score_page
+from schemas import PageAnalysis, ProductSchema
+
+PRODUCT_URL = "https://{store}/product/whole-milk"
+CATEGORY_URL = "https://{store}/category/dairy"
+TILES = [(f"Item {i}", f"${i}.99") for i in range(1, 10)]
+
+
+def test_heuristic_separates_product_and_category_pages():
+    product_score, _ = score_page(
+        product_page("Whole Milk", "$3.49", "1L", "Dairy", jsonld=True),
+        PRODUCT_URL.format(store="shop.example.com"),
+    )
+    category_score, _ = score_page(
+        category_page("Dairy", TILES), CATEGORY_URL.format(store="shop.example.com")
+    )
+    router = PageRouter()
+    assert router.route(product_score) is True
+    assert router.route(category_score) is False
+
+
+def test_router_tracks_accuracy_per_tier():
+    router = PageRouter(audit_every=2)
+    router.record("heuristic", 0.001, True)
+    router.record_outcome([("heuristic", True)], True)
+    router.record("heuristic", 0.001, False)
+    router.record_outcome([("heuristic", False)], True)
+
+    stats = router.stats()["tiers"]["heuristic"]
+    assert (stats["accepted"], stats["rejected"], stats["checked"]) == (1, 1, 2)
+    assert stats["accuracy"] == 0.5
+    assert [router.should_audit() for _ in range(4)] == [False, True, False, True]
+
+
+def install_fakes(monkeypatch, is_product):
+    """Fake both LLM tiers; returns the calls made to each"""
+    calls = {"classifier": 0, "extractor": 0}
+
+    async def fake_classify(text, url, budget=None):
+        calls["classifier"] += 1
+        return is_product
+
+    async def fake_extract(html, url, budget=None):
+        calls["extractor"] += 1
+        product = ProductSchema(url=url, name="Whole Milk", current_price="$3.49")
+        return PageAnalysis(is_product=is_product, product=product if is_product else None)
+
+    monkeypatch.setattr(scraper, "classify_page", fake_classify)
+    monkeypatch.setattr(scraper, "extract_page_data", fake_extract)
+    monkeypatch.setattr(scraper, "page_router", PageRouter(audit_every=0))
+    return calls
+
+
+def test_rejected_page_skips_all_llm_calls(monkeypatch):
+    calls = install_fakes(monkeypatch, is_product=False)
+    html = category_page("Dairy", TILES)
+    product = asyncio.run(
+        scraper.extract_product(html, CATEGORY_URL.format(store="routing-reject.example.com"))
+    )
+    assert product is None
+    assert calls == {"classifier": 0, "extractor": 0}
+
+
+def test_uncertain_page_is_classified_before_extraction(monkeypatch):
+    calls = install_fakes(monkeypatch, is_product=True)
+    # No markup, no cart button, nothing in the URL: neither clearly product nor listing
+    html = "<html><body><h1>Whole Milk</h1><p>$3.49</p></body></html>"
+    url = "https://routing-classify.example.com/whole-milk"
+    assert routing.ROUTE_REJECT_SCORE < score_page(html, url)[0] < routing.ROUTE_ACCEPT_SCORE
+
+    product = asyncio.run(scraper.extract_product(html, url))
+    assert product.name == "Whole Milk"
+    assert calls == {"classifier": 1, "extractor": 1}
+    tiers = scraper.page_router.stats()["tiers"]
+    assert tiers["heuristic"]["deferred"] == 1
+    assert tiers["classifier"]["accuracy"] == 1.0
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+
+from scheduler import FairScheduler, store_key
+
+
+async def grant_order(scheduler, stores):
+    """Queue one waiter per entry in stores behind a held slot; return grant order"""
+    order = []
+
+    async def worker(store):
+        async with scheduler.slot_async(store):
+            order.append(store)
+
+    await scheduler.acquire_async("holder")
+    tasks = [asyncio.create_task(worker(store)) for store in stores]
+    await asyncio.sleep(0)  # Let every worker queue up
+    scheduler.release()
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_free_slots_are_granted_immediately():
+    async def run():
+        scheduler = FairScheduler("test", 2)
+        await scheduler.acquire_async("a")
+        await scheduler.acquire_async("b")
+        assert scheduler.stats()["in_use"] == 2
+        scheduler.release()
+        scheduler.release()
+        assert scheduler.stats() == {"capacity": 2, "in_use": 0, "waiting": {}}
+
+    asyncio.run(run())
+
+
+def test_busy_store_does_not_starve_others():
+    async def run():
+        scheduler = FairScheduler("test", 1)
+        order = await grant_order(scheduler, ["big"] * 50 + ["small"])
+        assert order.index("small") <= 1
+        assert scheduler.stats()["in_use"] == 0
+
+    asyncio.run(run())
+
+
+def test_slots_are_shared_by_weight():
+    async def run():
+        scheduler = FairScheduler("test", 1)
+        scheduler.set_weight("a", 2)
+        order = await grant_order(scheduler, ["a"] * 12 + ["b"] * 12)
+        assert order[:9].count("a") == 6
+        assert order[:9].count("b") == 3
+
+    asyncio.run(run())
+
+
+def test_weights_from_concurrent_scrapes_stack():
+    scheduler = FairScheduler("test", 1)
+    scheduler.set_weight("a", 3)
+    scheduler.set_weight("a", 5)
+    assert scheduler.weight("a") == 5
+    scheduler.clear_weight("a", 5)
+    assert scheduler.weight("a") == 3
+    scheduler.clear_weight("a", 3)
+    assert scheduler.weight("a") == 1
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        scheduler = FairScheduler("test", 1)
+        await scheduler.acquire_async("holder")
+        waiter = asyncio.create_task(scheduler.acquire_async("a"))
+        await asyncio.sleep(0)
+        assert scheduler.stats()["waiting"] == {"a": 1}
+
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert scheduler.stats()["waiting"] == {}
+
+        scheduler.release()
+        assert scheduler.stats()["in_use"] == 0
+
+    asyncio.run(run())
+
+
+def test_slot_granted_to_cancelled_waiter_is_passed_on():
+    async def run():
+        scheduler = FairScheduler("test", 1)
+        await scheduler.acquire_async("holder")
+        first = asyncio.create_task(scheduler.acquire_async("a"))
+        second = asyncio.create_task(scheduler.acquire_async("b"))
+        await asyncio.sleep(0)
+
+        # Hand the slot to the first waiter, then cancel it before it resumes
+        scheduler.release()
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+
+        await asyncio.wait_for(second, timeout=1)
+        assert scheduler.stats()["in_use"] == 1
+        scheduler.release()
+        assert scheduler.stats()["in_use"] == 0
+
+    asyncio.run(run())
+
+
+def test_slots_hand_off_between_event_loops():
+    scheduler = FairScheduler("test", 1)
+    held = threading.Event()
+    release = threading.Event()
+    acquired = []
+
+    def holder():
+        async def run():
+            await scheduler.acquire_async("a")
+            held.set()
+            await asyncio.to_thread(release.wait)
+            scheduler.release()
+
+        asyncio.run(run())
+
+    def waiter():
+        async def run():
+            async with scheduler.slot_async("b"):
+                acquired.append("b")
+
+        asyncio.run(run())
+
+    threads = [threading.Thread(target=holder)]
+    threads[0].start()
+    held.wait(timeout=1)
+    threads.append(threading.Thread(target=waiter))
+    threads[1].start()
+    release.set()
+    for thread in threads:
+        thread.join(timeout=2)
+
+    assert acquired == ["b"]
+    assert scheduler.stats()["in_use"] == 0
+
+
+def test_store_key_ignores_case():
+    assert store_key("https://Shop.Example.com/product/1") == "shop.example.com"
@@ -0,0 +1,126 @@
+import asyncio
+import gzip
+
+from budget import STOP_MAX_PAGES, ScrapeBudget
+from cancellation import CancellationToken
+from proxies import ProxyPool
+from sitemaps import SITEMAP_NS, create_http_session, iter_sitemap_urls
+
+
+def index(*sitemaps):
+    locs = "".join(f"<sitemap><loc>http://shop.test/{name}</loc></sitemap>" for name in sitemaps)
+    return f'<sitemapindex xmlns="{SITEMAP_NS}">{locs}</sitemapindex>'.encode()
+
+
+def urlset(*products):
+    locs = "".join(f"<url><loc>http://shop.test/product/{name}</loc></url>" for name in products)
+    return f'<urlset xmlns="{SITEMAP_NS}">{locs}</urlset>'.encode()
+
+
+def serve(server, files):
+    server.files = {f"http://shop.test/{name}": body for name, body in files.items()}
+
+
+def collect(url, initial, budget=None, on_batch=None):
+    """Every batch iter_sitemap_urls yields for initial, read through the stand-in"""
+
+    async def run():
+        batches = []
+        async with create_http_session() as http:
+            sitemaps = [f"http://shop.test/{name}" for name in initial]
+            async for urls in iter_sitemap_urls(
+                sitemaps, "shop.test", http, budget, ProxyPool([url])
+            ):
+                batches.append(urls)
+                if on_batch:
+                    on_batch()
+        return batches
+
+    return asyncio.run(asyncio.wait_for(run(), 10))
+
+
+def fetches(server, name):
+    return server.requests.count(f"http://shop.test/{name}")
+
+
+def test_nested_indexes_are_followed_and_each_sitemap_read_once(stand_in_proxy):
+    server, url = stand_in_proxy()
+    serve(
+        server,
+        {
+            "index.xml": index("dairy.xml", "more-index.xml"),
+            # Listed again by the nested index
+            "more-index.xml": index("bakery.xml", "dairy.xml", "deeper-index.xml"),
+            "deeper-index.xml": index("produce.xml"),
+            "dairy.xml": urlset("milk", "eggs"),
+            "bakery.xml": urlset("bread"),
+            "produce.xml": urlset("apples"),
+        },
+    )
+
+    batches = collect(url, ["index.xml"])
+
+    assert sorted(url for urls in batches for url in urls) == [
+        f"http://shop.test/product/{name}" for name in ("apples", "bread", "eggs", "milk")
+    ]
+    for name in ("index.xml", "more-index.xml", "deeper-index.xml", "dairy.xml"):
+        assert fetches(server, name) == 1, name
+
+
+def test_gz_and_plain_twins_are_fetched_once(stand_in_proxy):
+    server, url = stand_in_proxy()
+    serve(
+        server,
+        {
+            "index.xml": index("dairy.xml", "dairy.xml.gz", "bakery.xml", "bakery.xml.gz"),
+            "dairy.xml": urlset("milk"),
+            "dairy.xml.gz": gzip.compress(urlset("milk")),
+            # Only the compressed twin exists; it is the fallback for the plain one
+            "bakery.xml": None,
+            "bakery.xml.gz": gzip.compress(urlset("bread")),
+        },
+    )
+
+    batches = collect(url, ["index.xml"])
+
+    assert sorted(batches) == [
+        ["http://shop.test/product/bread"],
+        ["http://shop.test/product/milk"],
+    ]
+    assert fetches(server, "dairy.xml") + fetches(server, "dairy.xml.gz") == 1
+    assert (fetches(server, "bakery.xml"), fetches(server, "bakery.xml.gz")) == (1, 1)
+
+
+def chain(depth):
+    """Sitemap indexes nested depth deep, each also listing one product sitemap"""
+    files = {}
+    for level in range(depth):
+        files[f"index-{level}.xml"] = index(f"level-{level}.xml", f"index-{level + 1}.xml")
+        files[f"level-{level}.xml"] = urlset(f"item-{level}")
+    files[f"index-{depth}.xml"] = urlset(f"item-{depth}")
+    return files
+
+
+def test_stopped_budget_stops_the_frontier(stand_in_proxy):
+    server, url = stand_in_proxy()
+    serve(server, chain(10))
+    limits = ScrapeBudget()
+
+    batches = collect(url, ["index-0.xml"], limits, lambda: limits.stop(STOP_MAX_PAGES))
+
+    assert batches
+    # Sitemaps already in flight may finish, but nothing further is fetched
+    assert fetches(server, "index-10.xml") == 0
+    assert len(server.requests) < len(chain(10))
+
+
+def test_cancelled_scrape_ends_the_stream_straight_away(stand_in_proxy):
+    server, url = stand_in_proxy()
+    serve(server, chain(10))
+    limits = ScrapeBudget()
+    limits.token = CancellationToken()
+
+    batches = collect(url, ["index-0.xml"], limits, limits.token.cancel)
+
+    assert len(batches) == 1
+    assert fetches(server, "index-10.xml") == 0
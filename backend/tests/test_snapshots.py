@@ -0,0 +1,108 @@
+import os
+
+from conftest import PAGE, FakeResponse
+from models import PageSnapshot, ScrapeSession, SessionStatus
+from pages import read_page
+from retention import janitor
+from scraper import reextract_session
+from snapshots import SnapshotStore, snapshot_store
+
+
+def test_store_round_trips_and_deduplicates(tmp_path):
+    store = SnapshotStore(root=str(tmp_path))
+    first = store.put(b"<html>milk</html>")
+    assert store.put(b"<html>milk</html>") == first
+    assert store.get(first) == b"<html>milk</html>"
+    assert len(list(tmp_path.rglob("*.zst"))) == 1
+
+
+def test_discard_skips_recently_used_objects(tmp_path):
+    store = SnapshotStore(root=str(tmp_path))
+    content_hash = store.put(b"<html>eggs</html>")
+    assert store.discard([content_hash]) == 0
+
+    os.utime(store.path_for(content_hash), (0, 0))
+    assert store.discard([content_hash]) == 1
+    assert not os.path.exists(store.path_for(content_hash))
+
+
+def test_reextract_queues_job_for_archived_session(client, executor, db, add_session):
+    source_id = add_session(snapshots=[("https://shop.example.com/product/1", b"<html>1</html>")])
+
+    response = client.post(f"/api/session/{source_id}/reextract")
+
+    assert response.status_code == 200
+    new_id = response.json()["session_id"]
+    new_session = db.query(ScrapeSession).filter(ScrapeSession.id == new_id).one()
+    assert new_session.total_pages == 1
+    [(fn, args)] = executor.jobs
+    assert fn is reextract_session
+    assert args[:2] == (source_id, new_id)
+
+
+def test_reextract_requires_archived_pages(client, executor, add_session):
+    source_id = add_session()
+
+    assert client.post(f"/api/session/{source_id}/reextract").status_code == 409
+    assert client.post("/api/session/missing/reextract").status_code == 404
+    assert executor.jobs == []
+
+
+def test_delete_keeps_objects_shared_with_other_sessions(client, db, add_session):
+    shared = ("https://shop.example.com/product/1", b"<html>shared</html>")
+    only_deleted = ("https://shop.example.com/product/2", b"<html>mine</html>")
+    deleted_id = add_session(snapshots=[shared, only_deleted])
+    add_session(snapshots=[shared])
+    shared_path, own_path = (
+        snapshot_store.path_for(snapshot_store.put(content))
+        for _, content in (shared, only_deleted)
+    )
+    # Age the objects past the garbage collection grace period
+    for path in (shared_path, own_path):
+        os.utime(path, (0, 0))
+
+    assert client.delete(f"/api/session/{deleted_id}").status_code == 200
+    assert janitor.wait(5)
+
+    assert db.query(PageSnapshot).count() == 1
+    assert os.path.exists(shared_path)
+    assert not os.path.exists(own_path)
+
+
+def test_reextract_session_replays_archive(client, add_session):
+    from schemas import ProductSchema
+
+    source_id = add_session(
+        snapshots=[
+            ("https://shop.example.com/product/1", b"<h1>Milk</h1>"),
+            ("https://shop.example.com/product/2", b"<h1>Eggs</h1>"),
+        ],
+    )
+    target_id = add_session(status=SessionStatus.QUEUED)
+
+    async def extractor(html, url, budget):
+        return ProductSchema(url=url, name=html[4:-5])
+
+    reextract_session(source_id, target_id, extractor=extractor)
+
+    response = client.get(f"/api/session/{target_id}").json()
+    assert response["status"] == "completed"
+    assert sorted(p["name"] for p in response["products"]) == ["Eggs", "Milk"]
+
+
+def test_reextract_recovers_jsonld_from_a_snapshot_cut_short(client, add_session):
+    # Archived before full reads: the body ends right after the JSON-LD block
+    page = read_page(FakeResponse(PAGE, chunk_size=64))
+    assert len(page.content) < len(PAGE)
+    source_id = add_session(snapshots=[("https://shop.example.com/product/milk", page.content)])
+    target_id = add_session(status=SessionStatus.QUEUED)
+
+    async def extractor(html, url, budget):
+        return None  # What the LLM makes of a page head with no product text
+
+    reextract_session(source_id, target_id, extractor=extractor)
+
+    response = client.get(f"/api/session/{target_id}").json()
+    assert [(p["name"], p["current_price"]) for p in response["products"]] == [
+        ("Whole Milk 1L", "$3.49")
+    ]
@@ -0,0 +1,97 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import scraper
+import stores
+from models import Store
+from proxies import ProxyPool
+from sitemaps import UrlFeed, discover_product_urls
+from stores import KnownStore, learn_url_patterns
+
+
+def counting_validate_url(calls):
+    async def validate_url(url):
+        calls.append(url)
+        return "https://www.shop.example.com", "www.shop.example.com", "Example Shop"
+
+    return validate_url
+
+
+def test_known_store_skips_validation(client, executor, db, monkeypatch):
+    calls = []
+    monkeypatch.setattr(scraper, "validate_url", counting_validate_url(calls))
+
+    first = client.post(
+        "/api/scrape",
+        json={
+            "url": "https://shop.example.com/",
+            "sticky_proxy": True,
+            "url_rules": {"strip_params": ["ref"]},
+        },
+    )
+    # Given as the alias it redirected from, and without any settings
+    second = client.post("/api/scrape", json={"url": "https://shop.example.com/deals"})
+
+    assert first.status_code == second.status_code == 200
+    assert calls == ["https://shop.example.com/"]
+    store = db.get(Store, "www.shop.example.com")
+    assert store.name == "Example Shop"
+
+    (_, second_args) = executor.jobs[1]
+    assert second_args[1:3] == ("https://www.shop.example.com", "www.shop.example.com")
+    # Saved crawl settings carry over to the second scrape
+    assert second_args[5].strip_params == ["ref"]
+    assert second_args[6] is True
+
+
+def test_stale_store_is_validated_again(client, executor, db, monkeypatch):
+    calls = []
+    monkeypatch.setattr(scraper, "validate_url", counting_validate_url(calls))
+    client.post("/api/scrape", json={"url": "https://www.shop.example.com/"})
+
+    store = db.get(Store, "www.shop.example.com")
+    store.validated_at = datetime.now(timezone.utc) - timedelta(
+        hours=stores.STORE_REFRESH_HOURS + 1
+    )
+    db.commit()
+    client.post("/api/scrape", json={"url": "https://www.shop.example.com/"})
+
+    assert len(calls) == 2
+
+
+def test_url_patterns_keep_common_product_prefixes():
+    urls = [f"https://shop.test/product/{i}" for i in range(40)]
+    urls += ["https://shop.test/groceries/milk", "https://shop.test/"]
+    assert learn_url_patterns(urls) == ["/product/"]
+
+
+def test_url_patterns_keep_the_product_segment_under_a_locale_prefix():
+    urls = [f"https://shop.test/en/product/{i}" for i in range(30)]
+    urls += [f"https://shop.test/fr/groceries/item-{i}" for i in range(10)]
+    urls += ["https://shop.test/en/about-us"]
+    assert learn_url_patterns(urls) == ["/en/product/", "/fr/groceries/"]
+
+
+def test_discovery_uses_cached_sitemaps(stand_in_proxy):
+    server, url = stand_in_proxy()
+    row = Store(
+        netloc="shop.test",
+        base_url="http://shop.test",
+        sitemap_urls='["http://shop.test/sitemap.xml"]',
+        url_patterns='["/product/"]',
+        validated_at=datetime.now(timezone.utc),
+        discovered_at=datetime.now(timezone.utc),
+    )
+    feed = UrlFeed()
+    asyncio.run(
+        discover_product_urls(
+            "http://shop.test",
+            "shop.test",
+            feed,
+            proxies=ProxyPool([url]),
+            known=KnownStore(row),
+        )
+    )
+
+    assert feed.count == 2
+    assert server.requests == ["http://shop.test/sitemap.xml"]  # No robots.txt or probing
@@ -0,0 +1,64 @@
+from conftest import PRODUCTS, category_page, product_page, sample
+from templates import SPOT_CHECK_MAX_FAILURES, TEMPLATE_SAMPLE_PAGES, TemplateLearner, learn_template
+
+
+def test_learned_template_reproduces_unseen_product():
+    negatives = [category_page("Bakery", [("Rye Bread", "$4.00"), ("Bagels", "$3.00")])]
+    template = learn_template([sample(*p) for p in PRODUCTS[:5]], negatives)
+    assert template is not None
+
+    name, price, size, category = PRODUCTS[5]
+    product = template.extract(product_page(*PRODUCTS[5]), "https://shop.example.com/product/x")
+
+    assert product.name == name
+    assert product.current_price == price
+    assert product.unit_size == size
+    assert product.category == category
+    assert product.image_url == "https://shop.example.com/img/Cheddar-Cheese.jpg"
+
+
+def test_category_page_does_not_fit_template():
+    negatives = [category_page("Bakery", [("Rye Bread", "$4.00"), ("Bagels", "$3.00")])]
+    template = learn_template([sample(*p) for p in PRODUCTS[:5]], negatives)
+
+    single_tile = category_page("Dairy & Eggs", [("Whole Milk", "$3.49")])
+    assert template.extract(single_tile, "https://shop.example.com/groceries/dairy") is None
+
+
+def test_product_markers_gate_template_without_negatives():
+    template = learn_template([sample(*p, jsonld=True) for p in PRODUCTS[:5]])
+    assert template is not None
+    assert template.signals == {"jsonld"}
+
+    # Same layout but no product markup, as on a landing page reusing the layout
+    unmarked = product_page(*PRODUCTS[5])
+    assert template.extract(unmarked, "https://shop.example.com/groceries/x") is None
+    marked = product_page(*PRODUCTS[5], jsonld=True)
+    assert template.extract(marked, "https://shop.example.com/product/x").name == "Cheddar Cheese"
+
+
+def test_no_template_without_a_way_to_reject_non_products():
+    assert learn_template([sample(*p) for p in PRODUCTS[:5]]) is None
+
+
+def test_learner_relearns_after_drift():
+    learner = TemplateLearner("shop.example.com")
+    learner.add_negative(category_page("Bakery", [("Rye Bread", "$4.00")]))
+    for p in PRODUCTS[:TEMPLATE_SAMPLE_PAGES]:
+        learner.add_sample(*sample(*p))
+    assert learner.ready
+
+    html, url, llm_product = sample(*PRODUCTS[5])
+    template_product = learner.extract(html, url)
+    assert learner.record_check(template_product, llm_product)
+
+    # The store changed its markup: the template now disagrees with the LLM
+    wrong = template_product.model_copy(update={"current_price": "$0.01"})
+    for _ in range(SPOT_CHECK_MAX_FAILURES):
+        learner.record_check(wrong, llm_product)
+
+    assert not learner.ready
+    assert learner.relearns == 1
+    for p in PRODUCTS[1:TEMPLATE_SAMPLE_PAGES + 1]:
+        learner.add_sample(*sample(*p))
+    assert learner.ready